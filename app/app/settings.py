@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -39,21 +40,23 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     'rest_framework',
-    'rest_framework.authtoken',
 
     'core',
     'users',
-    'recipe'
+    'recipe',
+    'batch',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.budgets.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -80,14 +83,59 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DB_SHARDS adds databases holding user-sharded recipe data
+# (see core/sharding.py), e.g. DB_SHARDS=shard1,shard2. Each shard uses
+# the database <DB_NAME>_<alias>, on DB_HOST_<ALIAS> if set.
+# DB_ENGINE=sqlite3 keeps every database in a local file, for development.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+DB_SHARDS = [
+    alias for alias in os.environ.get('DB_SHARDS', '').split(',') if alias
+]
+
+
+def database(alias):
+    if DB_ENGINE == 'sqlite3':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, f'db_{alias}.sqlite3'),
+        }
+    name = os.environ.get('DB_NAME')
+    return {
         'ENGINE': 'django.db.backends.postgresql',
-        'HOST': os.environ.get('DB_HOST'),
-        'NAME': os.environ.get('DB_NAME'),
+        'HOST': os.environ.get(
+            f'DB_HOST_{alias.upper()}', os.environ.get('DB_HOST')
+        ),
+        'NAME': name if alias == 'default' else f'{name}_{alias}',
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
     }
+
+
+DATABASES = {
+    alias: database(alias) for alias in ['default'] + DB_SHARDS
+}
+
+DATABASE_ROUTERS = ['core.sharding.UserShardRouter']
+
+SHARD_DATABASES = ['default'] + DB_SHARDS
+
+# shard number k allocates ids from k * SHARD_ID_BLOCK on
+SHARD_ID_BLOCK = 100000000
+# moving a user's data waits that long for their running writes to commit
+SHARD_MOVE_GRACE_SECONDS = 5
+
+
+# Cache shared by all the workers (shard map, throttling buckets),
+# e.g. CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# with CACHE_LOCATION=memcached:11211
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
 }
 
 
@@ -110,6 +158,33 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = ['core.backends.EmailBackend']
+
+# PBKDF2 cost, passwords are rehashed on login when it changes
+# (see the benchmark_login command to pick it)
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 120000)
+)
+
+PASSWORD_HASHERS = [
+    'core.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
+# Authentication tokens (core.models.AuthToken): expire after AUTH_TOKEN_TTL
+# without use; the expiry is pushed forward at most once per
+# AUTH_TOKEN_REFRESH_INTERVAL. Workers cache tokens, and notice revoked
+# ones, within AUTH_TOKEN_CACHE_SECONDS, re-reading revocations made up to
+# AUTH_TOKEN_REVOCATION_LAG before each check, for slow commits.
+AUTH_TOKEN_TTL = timedelta(days=14)
+AUTH_TOKEN_REFRESH_INTERVAL = timedelta(hours=1)
+AUTH_TOKEN_CACHE_SECONDS = 30
+AUTH_TOKEN_REVOCATION_LAG = timedelta(minutes=1)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
 
@@ -132,6 +207,121 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 
+# Media serving (core.views.serve_media): 'nginx' answers with
+# X-Accel-Redirect to MEDIA_ACCEL_PREFIX (an internal location aliasing
+# MEDIA_ROOT), 'sendfile' with X-Sendfile; empty serves files from Django
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Recipe image renditions (recipe.renditions), made on demand at one of
+# RENDITION_WIDTHS and kept in an LRU disk cache
+RENDITION_CACHE_DIR = os.environ.get(
+    'RENDITION_CACHE_DIR', '/vol/web/renditions'
+)
+RENDITION_CACHE_MAX_BYTES = int(
+    os.environ.get('RENDITION_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+)
+RENDITION_WIDTHS = (64, 160, 320, 640, 1280, 1920)
+
+# uploads are hashed as they stream in, see core.uploads
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.HashingMemoryFileUploadHandler',
+    'core.uploads.HashingTemporaryFileUploadHandler',
+]
+
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+REST_FRAMEWORK = {
+    # MessagePack, for the mobile clients, through content negotiation
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+    ),
+    'TEST_REQUEST_RENDERER_CLASSES': (
+        'rest_framework.renderers.MultiPartRenderer',
+        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.UserEndpointThrottle',
+    ),
+    # token buckets: 'n/period' allows bursts of n requests
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',
+        'read': '600/min',
+        'write': '120/min',
+        'upload': '20/min',
+    },
+}
+
+# /api/batch/: requests per batch, and threads running GET batches
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Serve recipe details from documents rendered on write (recipe.documents);
+# run rebuild_recipe_documents after turning it on
+RECIPE_DOCUMENTS = os.environ.get('RECIPE_DOCUMENTS', '') == '1'
+# the scheme and host clients use, image URLs in documents are built on it
+RECIPE_DOCUMENTS_BASE_URL = os.environ.get(
+    'RECIPE_DOCUMENTS_BASE_URL', 'http://localhost:8000/'
+)
+
+# Tag/ingredient autocomplete (recipe.autocomplete): per worker in-memory
+# name indexes, for up to AUTOCOMPLETE_INDEX_USERS users, instead of
+# database queries
+AUTOCOMPLETE_MEMORY_INDEX = os.environ.get('AUTOCOMPLETE_MEMORY_INDEX') == '1'
+AUTOCOMPLETE_INDEX_USERS = 1000
+
+# Similar recipes (recipe.similarity): users whose incidence matrix each
+# worker keeps
+SIMILARITY_INDEX_USERS = 100
+
+# Incremental sync (recipe.sync): cursors lag behind to pick up slow
+# commits, deletions can be synced for SYNC_TOMBSTONE_DAYS
+SYNC_LAG = timedelta(seconds=5)
+SYNC_TOMBSTONE_DAYS = 30
+
+# Server-sent event streams (recipe.events): keepalive interval, the
+# time after which streams end and clients reconnect, and the most streams
+# a worker keeps open. Each stream holds a worker thread, so serve them
+# with gevent workers; with sync workers keep the limit low
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
+EVENT_STREAM_MAX_SECONDS = 300
+EVENT_STREAM_MAX_OPEN = int(os.environ.get('EVENT_STREAM_MAX_OPEN', 1000))
+
+# Transactional outbox (recipe.outbox): changes are recorded only when a
+# webhook is set, dispatch_outbox delivers them
+OUTBOX_WEBHOOK_URL = os.environ.get('OUTBOX_WEBHOOK_URL', '')
+OUTBOX_WEBHOOK_SECRET = os.environ.get('OUTBOX_WEBHOOK_SECRET', '')
+OUTBOX_TIMEOUT_SECONDS = 10
+OUTBOX_MAX_ATTEMPTS = 12
+
+# Query budgets of views (core.budgets): 'raise' or 'log' when a view makes
+# more queries than it declares, 'off' to not count them
+QUERY_BUDGETS = os.environ.get('QUERY_BUDGETS', 'raise' if DEBUG else 'log')
+
+# Idempotency-Key on creates (core.idempotency): how long responses are
+# replayed, and the most a request holds back its duplicates
+IDEMPOTENCY_KEY_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_LOCK_SECONDS = 30
+
+# Response compression (core.compression): gzip level, smallest body worth
+# it, types compressed (prefixes), and how long compressed bodies of
+# responses with an ETag are cached
+GZIP_LEVEL = 6
+GZIP_MIN_LENGTH = 1024
+GZIP_CONTENT_TYPES = (
+    'application/json', 'application/msgpack', 'application/javascript',
+    'application/xml', 'text/',
+)
+COMPRESSION_CACHE_SECONDS = 60 * 60
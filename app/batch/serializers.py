@@ -0,0 +1,34 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Serializer for one of the requests of a batch"""
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'),
+        default='GET'
+    )
+    # e.g. /api/recipe/recipes/?tags=1
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+    # e.g. {'If-None-Match': '"..."'}, the batch's own headers aren't passed
+    headers = serializers.DictField(
+        child=serializers.CharField(allow_blank=True), required=False
+    )
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of API requests"""
+    requests = SubRequestSerializer(many=True)
+    # run GET requests on a thread pool, when they are all GET
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, requests):
+        """Validate the number of requests in the batch"""
+        if not requests:
+            raise serializers.ValidationError('No requests given')
+        if len(requests) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests per batch'
+            )
+        return requests
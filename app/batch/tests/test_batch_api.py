@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.utils import TestCase
+from recipe import events
+from recipe.documents import rebuild_documents
+
+
+BATCH_URL = reverse('batch:batch')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class PublicBatchApiTests(TestCase):
+    """Test unauthenticated batch requests"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that the batch itself requires authentication"""
+        res = self.client.post(
+            BATCH_URL, {'requests': [{'path': TAGS_URL}]}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(TestCase):
+    """Test batches of an authenticated user"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'pass1234',
+            name='Test'
+        )
+        self.client.force_authenticate(self.user)
+
+    def post(self, requests, **extra):
+        return self.client.post(
+            BATCH_URL, {'requests': requests, **extra}, format='json'
+        )
+
+    def test_startup_batch(self):
+        """Test running several requests of the app in one batch"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.post([
+            {'path': ME_URL},
+            {'path': TAGS_URL},
+            {'path': RECIPES_URL},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, tags, recipes = res.data
+        self.assertEqual(me['status'], status.HTTP_200_OK)
+        self.assertEqual(me['body']['email'], self.user.email)
+        self.assertEqual(tags['body'][0]['name'], 'Vegan')
+        self.assertEqual(recipes['body'], [])
+
+    def test_write_request(self):
+        """Test that sub-requests can write, as the batch user"""
+        res = self.post([
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Dessert'}},
+            {'path': TAGS_URL},
+        ])
+
+        created, tags = res.data
+        self.assertEqual(created['status'], status.HTTP_201_CREATED)
+        self.assertTrue(
+            Tag.objects.for_user(self.user).filter(name='Dessert').exists()
+        )
+        self.assertEqual(len(tags['body']), 1)
+
+    def test_errors_per_request(self):
+        """Test failing sub-requests don't fail the batch"""
+        res = self.post([
+            {'path': '/api/nowhere/'},
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': ''}},
+            {'path': BATCH_URL},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [sub['status'] for sub in res.data],
+            [status.HTTP_404_NOT_FOUND, status.HTTP_400_BAD_REQUEST,
+             status.HTTP_400_BAD_REQUEST]
+        )
+
+    def test_batch_size_limited(self):
+        """Test that batches can't be empty or too large"""
+        self.assertEqual(
+            self.post([]).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        res = self.post([{'path': TAGS_URL}] * 100)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_parallel_reads(self):
+        """Test that GET batches can run on a thread pool"""
+        res = self.post([{'path': ME_URL}] * 3, parallel=True)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [sub['body']['email'] for sub in res.data], [self.user.email] * 3
+        )
+
+    def test_request_headers_not_shared(self):
+        """Test the batch's own headers don't reach the sub-requests"""
+        res = self.client.post(
+            BATCH_URL,
+            {'requests': [
+                {'method': 'POST', 'path': TAGS_URL,
+                 'body': {'name': 'Vegan'}},
+                {'method': 'POST', 'path': TAGS_URL,
+                 'body': {'name': 'Vegan'}},
+            ]},
+            format='json', HTTP_IDEMPOTENCY_KEY='batch-key'
+        )
+
+        self.assertEqual(
+            [sub['status'] for sub in res.data],
+            [status.HTTP_201_CREATED, status.HTTP_201_CREATED]
+        )
+        self.assertNotIn('Idempotent-Replayed', res.data[1]['headers'])
+        self.assertEqual(Tag.objects.for_user(self.user).count(), 2)
+
+    @override_settings(
+        RECIPE_DOCUMENTS=True, RECIPE_DOCUMENTS_BASE_URL='http://testserver'
+    )
+    def test_sub_request_headers(self):
+        """Test that sub-requests carry their own headers"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price='7.00'
+        )
+        # built on commit, which TestCase doesn't do
+        rebuild_documents([recipe.id], recipe._state.db)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        etag = self.post([{'path': url}]).data[0]['headers']['ETag']
+
+        res = self.post([
+            {'path': url, 'headers': {'If-None-Match': etag}},
+            {'path': url},
+        ])
+
+        self.assertEqual(
+            [sub['status'] for sub in res.data],
+            [status.HTTP_304_NOT_MODIFIED, status.HTTP_200_OK]
+        )
+
+    def test_django_view_errors_per_request(self):
+        """Test errors raised by plain Django views stay in their request"""
+        res = self.post([
+            {'path': f'{settings.MEDIA_URL}upload/missing.jpg'},
+            {'path': ME_URL},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [sub['status'] for sub in res.data],
+            [status.HTTP_404_NOT_FOUND, status.HTTP_200_OK]
+        )
+
+    def test_streaming_responses_refused(self):
+        """Test event streams and files are refused, and released"""
+        res = self.post([
+            {'path': reverse('recipe:events')},
+            {'path': ME_URL},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [sub['status'] for sub in res.data],
+            [status.HTTP_400_BAD_REQUEST, status.HTTP_200_OK]
+        )
+        self.assertEqual(events.bus.subscriptions, {})
@@ -0,0 +1,164 @@
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import Http404
+from django.urls import resolve, Resolver404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from batch.serializers import BatchSerializer
+from core.authentication import ExpiringTokenAuthentication
+
+
+logger = logging.getLogger(__name__)
+
+# environ keys copied from the batch to its sub-requests: who and where
+# the client is, what it accepts. Other headers (Idempotency-Key,
+# If-None-Match...) are per request, sub-requests bring their own.
+SHARED_ENVIRON = (
+    'HTTP_AUTHORIZATION', 'REMOTE_ADDR', 'HTTP_X_FORWARDED_FOR',
+    'HTTP_X_FORWARDED_PROTO', 'HTTP_HOST', 'SCRIPT_NAME', 'SERVER_NAME',
+    'SERVER_PORT', 'SERVER_PROTOCOL', 'wsgi.url_scheme',
+)
+SHARED_ENVIRON_PREFIXES = ('HTTP_ACCEPT',)
+# set from the sub-request itself
+OWN_HEADERS = ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH')
+
+
+def close_unsent(response):
+    """Release what a response that won't be sent holds (streams, files)"""
+    # response.close() would also send request_finished, closing the
+    # database connections of the batch in the middle of it
+    for closable in response._closable_objects:
+        closable.close()
+
+
+class BatchView(APIView):
+    """Run many API requests in one round trip
+
+    Sub-requests go through the URL routing and views in process, as the
+    user authenticated for the batch, so their permissions and throttling
+    apply; middleware doesn't run for them.
+    """
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        """Run the requests of the batch, return their responses in order"""
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requests = serializer.validated_data['requests']
+
+        parallel = serializer.validated_data['parallel'] and all(
+            sub['method'] == 'GET' for sub in requests
+        )
+        if parallel and len(requests) > 1:
+            with ThreadPoolExecutor(settings.BATCH_MAX_WORKERS) as executor:
+                results = list(executor.map(
+                    lambda sub: self.run_in_thread(request, sub), requests
+                ))
+        else:
+            results = [self.run(request, sub) for sub in requests]
+
+        return Response(results, status=status.HTTP_200_OK)
+
+    def run_in_thread(self, request, sub):
+        """Run a sub-request, closing the connections the thread opened"""
+        try:
+            return self.run(request, sub)
+        finally:
+            connections.close_all()
+
+    def run(self, request, sub):
+        """Run a sub-request, return its status, headers and body"""
+        url = urlsplit(sub['path'])
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return self.error(status.HTTP_404_NOT_FOUND, 'Not found.')
+        if getattr(match.func, 'cls', None) is BatchView:
+            return self.error(
+                status.HTTP_400_BAD_REQUEST, 'Batches can not be nested.'
+            )
+
+        try:
+            response = match.func(
+                self.sub_request(request, sub, url),
+                *match.args, **match.kwargs
+            )
+        # DRF views answer their own errors, plain Django views raise them
+        except Http404:
+            return self.error(status.HTTP_404_NOT_FOUND, 'Not found.')
+        except PermissionDenied:
+            return self.error(status.HTTP_403_FORBIDDEN, 'Permission denied.')
+        except Exception:
+            logger.exception(
+                'Batch sub-request %s %s failed', sub['method'], sub['path']
+            )
+            return self.error(
+                status.HTTP_500_INTERNAL_SERVER_ERROR, 'Server error.'
+            )
+        if response.streaming:
+            # events streams and files, they never end or are not JSON
+            close_unsent(response)
+            return self.error(
+                status.HTTP_400_BAD_REQUEST,
+                'Streaming responses can not be batched.'
+            )
+        if getattr(response, 'data', None) is not None:
+            # DRF response, no need to render it to read it back
+            body = response.data
+        else:
+            if hasattr(response, 'render'):
+                response.render()
+            body = response.content.decode() if response.content else None
+
+        return {
+            'status': response.status_code,
+            'headers': {
+                key: value for key, value in response.items()
+                if key != 'Content-Type'
+            },
+            'body': body,
+        }
+
+    def sub_request(self, request, sub, url):
+        """Build the Django request for sub, authenticated as request"""
+        body = b''
+        if 'body' in sub:
+            body = json.dumps(sub['body']).encode()
+
+        environ = {
+            key: value for key, value in request.META.items()
+            if key in SHARED_ENVIRON or key.startswith(SHARED_ENVIRON_PREFIXES)
+        }
+        for name, value in sub.get('headers', {}).items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in OWN_HEADERS:
+                environ[key] = value
+        environ.update({
+            'REQUEST_METHOD': sub['method'],
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        })
+        sub_request = WSGIRequest(environ)
+        # authenticated once, for the whole batch
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+        return sub_request
+
+    def error(self, status_code, detail):
+        return {'status': status_code, 'headers': {},
+                'body': {'detail': detail}}
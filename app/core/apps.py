@@ -1,5 +1,29 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_migrate, pre_delete, pre_save
+)
+
+
+def reserve_shard_ids(sender, using, **kwargs):
+    """Keep the ids allocated on each shard apart (see core.sharding)"""
+    from core.sharding import reserve_id_range
+    reserve_id_range(using)
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        post_migrate.connect(reserve_shard_ids, sender=self)
+        from core.sharding import refuse_moving_writes
+        for signal in (pre_save, pre_delete, m2m_changed):
+            signal.connect(refuse_moving_writes)
+        from core.idempotency import check_shared_cache
+        checks.register(check_shared_cache, checks.Tags.caches)
+        from core.purge import delete_leftover_data, delete_shard_data
+        pre_delete.connect(delete_shard_data, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(
+            delete_leftover_data, sender=settings.AUTH_USER_MODEL
+        )
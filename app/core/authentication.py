@@ -0,0 +1,161 @@
+"""Authentication with the expiring tokens of core.models.AuthToken
+
+Each worker keeps recently authenticated tokens in memory for
+AUTH_TOKEN_CACHE_SECONDS, so most requests need no token lookup. Revoked
+tokens are rejected through an in-memory set of the revoked, unexpired
+keys, topped up from the database as often. Like the sync cursors, each
+top-up reads from AUTH_TOKEN_REVOCATION_LAG before the previous one, so
+revocations committed after that read are still picked up.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.models import AuthToken
+
+
+class RevocationSet:
+    """Keys of revoked tokens that haven't expired yet"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.expires = {}
+        self.refreshed_at = None
+        # only the revocations from then on are read next time
+        self.revoked_since = None
+
+    def refresh(self, now):
+        """Load the revocations made since the last refresh"""
+        tokens = AuthToken.objects.filter(
+            revoked_at__isnull=False, expires__gt=now
+        )
+        if self.revoked_since is not None:
+            tokens = tokens.filter(revoked_at__gte=self.revoked_since)
+        self.expires.update(tokens.values_list('key', 'expires'))
+        # lagging behind, for revocations made before now committed later
+        self.revoked_since = now - settings.AUTH_TOKEN_REVOCATION_LAG
+        self.expires = {
+            key: expires for key, expires in self.expires.items()
+            if expires > now
+        }
+        self.refreshed_at = now
+
+    def add(self, key, expires):
+        """Revoke key in this worker at once, others see it on refresh"""
+        with self.lock:
+            self.expires[key] = expires
+
+    def __contains__(self, key):
+        now = timezone.now()
+        with self.lock:
+            if self.refreshed_at is None or (
+                now - self.refreshed_at
+            ).total_seconds() > settings.AUTH_TOKEN_CACHE_SECONDS:
+                self.refresh(now)
+            return key in self.expires
+
+
+revoked_tokens = RevocationSet()
+
+
+class TokenCache:
+    """Recently authenticated tokens of this worker: key -> (user, expires)"""
+    max_size = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, expires, cached_at = entry
+            if (now - cached_at).total_seconds() > \
+                    settings.AUTH_TOKEN_CACHE_SECONDS:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, user, expires, cached_at):
+        with self.lock:
+            self.entries[key] = (user, expires, cached_at)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def forget(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def forget_user(self, user_id):
+        with self.lock:
+            for key in [
+                key for key, entry in self.entries.items()
+                if entry[0].pk == user_id
+            ]:
+                del self.entries[key]
+
+
+token_cache = TokenCache()
+
+
+def forget_cached_user(sender, instance, **kwargs):
+    """Don't serve a stale user from the token cache after it changed"""
+    token_cache.forget_user(instance.pk)
+
+
+post_save.connect(forget_cached_user, sender=get_user_model())
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Authenticate with an AuthToken: 'Authorization: Token <key>'"""
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        if key in revoked_tokens:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        now = timezone.now()
+        cached = token_cache.get(key, now)
+        if cached is None:
+            token = AuthToken.objects.select_related('user').filter(
+                key=key, revoked_at__isnull=True
+            ).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user, expires, cached_at = token.user, token.expires, now
+        else:
+            # cached_at is kept, so the user is reloaded now and then
+            user, expires, cached_at = cached
+
+        if expires <= now:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        # sliding expiry, written at most once per refresh interval
+        if expires - now < \
+                settings.AUTH_TOKEN_TTL - settings.AUTH_TOKEN_REFRESH_INTERVAL:
+            expires = now + settings.AUTH_TOKEN_TTL
+            AuthToken.objects.filter(key=key).update(expires=expires)
+        token_cache.set(key, user, expires, cached_at)
+        return (user, key)
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+
+class EmailBackend(ModelBackend):
+    """Authenticate by case-insensitive email and password
+
+    The lookup matches the LOWER(email) index (migration 0007), the
+    password is then checked, and rehashed if the hasher cost changed.
+    """
+
+    def authenticate(self, request, username=None, password=None,
+                     email=None, **kwargs):
+        email = email or username
+        if email is None or password is None:
+            return None
+
+        UserModel = get_user_model()
+        users = list(
+            UserModel._default_manager.annotate(
+                email_lower=Lower('email')
+            ).filter(email_lower=email.lower())[:2]
+        )
+        if not users:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            return None
+
+        # older accounts may only differ by case, prefer the exact one
+        user = next((u for u in users if u.email == email), users[0])
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,139 @@
+"""Query budgets: the most SQL queries a view may make per request
+
+Views declare them with a query_budget attribute, viewsets per action with
+query_budgets = {'list': 3, ...} or @action(query_budget=3). The
+QueryBudgetMiddleware counts the queries of each request (on every
+database alias) and, per QUERY_BUDGETS, logs ('log') or raises
+QueryBudgetExceeded ('raise') when a view goes over, listing the query
+fingerprints. In 'raise' mode, the default with DEBUG, every test making
+a request through a budgeted view enforces its budget.
+
+Queries run under uncounted() don't count: the shard map lookups, made
+once per user and worker, would otherwise put views over their budget
+only with DB_SHARDS set.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# literals, and IN lists of any length, don't make different queries
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+_uncounted = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@contextmanager
+def uncounted():
+    """Leave the queries run inside out of the query budgets"""
+    depth = getattr(_uncounted, 'depth', 0)
+    _uncounted.depth = depth + 1
+    try:
+        yield
+    finally:
+        _uncounted.depth = depth
+
+
+def fingerprint(sql):
+    """Return sql without its parameters and literals"""
+    sql = IN_LIST_RE.sub('(...)', sql)
+    return LITERAL_RE.sub('?', sql)
+
+
+def view_budget(view_func, method):
+    """Return the query budget of a (DRF) view for method, or None"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return None
+    # @action(query_budget=...)
+    budget = getattr(view_func, 'initkwargs', {}).get('query_budget')
+    if budget is not None:
+        return budget
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(method) or (
+            actions.get('get') if method == 'head' else None
+        )
+        budget = getattr(cls, 'query_budgets', {}).get(action)
+        if budget is not None:
+            return budget
+    return getattr(cls, 'query_budget', None)
+
+
+class QueryCounter:
+    """Context manager keeping the queries run on every alias"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(_uncounted, 'depth', 0):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def fingerprints(self):
+        """Return [(fingerprint, count)], the most repeated first"""
+        return Counter(map(fingerprint, self.queries)).most_common()
+
+
+def report(name, budget, counter):
+    lines = [
+        f'{name} made {len(counter)} queries, over its budget of {budget}:'
+    ]
+    for sql, count in counter.fingerprints():
+        lines.append(f'{count:>4} x {sql}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    """Check the views against their query budgets (see the module)
+
+    It goes last, so only the queries of the view itself count.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.QUERY_BUDGETS not in ('log', 'raise'):
+            return self.get_response(request)
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(counter) > budget:
+            message = report(
+                f'{request.method} {request.path}', budget, counter
+            )
+            if settings.QUERY_BUDGETS == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_budget(
+            view_func, request.method.lower()
+        )
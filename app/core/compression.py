@@ -0,0 +1,142 @@
+"""Gzip compression of responses
+
+Django's GZipMiddleware compresses anything over 200 bytes, including
+already compressed images, ignores q=0 in Accept-Encoding, and holds back
+streamed chunks until the compressor has a block to emit, which stalls
+event streams. CompressionMiddleware instead:
+
+- compresses only GZIP_CONTENT_TYPES, from GZIP_MIN_LENGTH bytes on, and
+  never partial (206) or empty responses;
+- compresses streamed responses chunk by chunk, flushing each chunk so
+  clients get it right away;
+- weakens strong ETags (the compressed body is another representation)
+  and strips W/ from If-None-Match, which compares weakly anyway, so
+  views comparing their own ETags still match;
+- keeps the compressed body of responses with a strong ETag in the cache
+  for COMPRESSION_CACHE_SECONDS, so cached responses (e.g. recipe
+  documents) are compressed once per version, not per request.
+"""
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+
+# memcached keeps items up to 1MB
+MAX_CACHED_LENGTH = 1024 * 1024
+
+
+def accepts_gzip(accept_encoding):
+    """Return whether an Accept-Encoding header allows gzip"""
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
+
+
+def compressor(level):
+    # wbits 16 + MAX_WBITS: gzip header and trailer
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress(data, level):
+    gzip = compressor(level)
+    return gzip.compress(data) + gzip.flush()
+
+
+def compress_chunks(chunks, level):
+    """Compress an iterable of chunks, each one flushed through"""
+    gzip = compressor(level)
+    for chunk in chunks:
+        data = gzip.compress(chunk) + gzip.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield gzip.flush()
+
+
+def compressible(response):
+    if response.status_code in (204, 206, 304) or \
+            response.has_header('Content-Encoding'):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    if not content_type.startswith(settings.GZIP_CONTENT_TYPES):
+        return False
+    return response.streaming or \
+        len(response.content) >= settings.GZIP_MIN_LENGTH
+
+
+def cache_key(request, response, etag):
+    # a strong ETag stands for the same bytes, for that URL and type
+    representation = '\n'.join(
+        (request.get_full_path(), response['Content-Type'], etag)
+    )
+    digest = hashlib.sha1(representation.encode()).hexdigest()
+    return f'gzip:{settings.GZIP_LEVEL}:{digest}'
+
+
+class CompressionMiddleware:
+    """Compress responses for clients accepting gzip (see the module)
+
+    It goes near the top, before middleware reading response bodies.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and 'W/' in if_none_match:
+            request.META['HTTP_IF_NONE_MATCH'] = if_none_match.replace(
+                'W/', ''
+            )
+        response = self.get_response(request)
+        if not compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        etag = response.get('ETag')
+        if response.streaming:
+            response.streaming_content = compress_chunks(
+                response.streaming_content, settings.GZIP_LEVEL
+            )
+            del response['Content-Length']
+        else:
+            content = self.compressed_content(request, response, etag)
+            if content is None:
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'gzip'
+        return response
+
+    def compressed_content(self, request, response, etag):
+        """Return the compressed body, None if compressing doesn't pay"""
+        key = None
+        if etag and etag.startswith('"') and request.method == 'GET' and \
+                settings.COMPRESSION_CACHE_SECONDS:
+            key = cache_key(request, response, etag)
+            content = cache.get(key)
+            if content is not None:
+                return content
+        content = compress(response.content, settings.GZIP_LEVEL)
+        if len(content) >= len(response.content):
+            return None
+        if key and len(content) <= MAX_CACHED_LENGTH:
+            cache.set(key, content, settings.COMPRESSION_CACHE_SECONDS)
+        return content
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 hasher with its cost set by PASSWORD_HASH_ITERATIONS
+
+    Keeps Django's algorithm name, so existing hashes still verify. When
+    the setting changes, passwords are rehashed at the new cost on the
+    next successful login (see must_update()).
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
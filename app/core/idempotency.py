@@ -0,0 +1,134 @@
+"""Idempotency-Key support for create endpoints
+
+Clients retrying a POST send the same Idempotency-Key header; the first
+response is kept in the default cache for IDEMPOTENCY_KEY_SECONDS and
+replayed to the retries instead of creating the object again. While the
+first request runs, a cache.add() lock turns duplicates away with a 409,
+so concurrent retries never both write. Keys are scoped to the user (or
+the client address, for anonymous requests) and the view.
+
+The lock only holds across workers with a shared cache (memcached, redis,
+...): a system check warns when the default cache is local to the process.
+"""
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# headers of the first response replayed along with its body
+REPLAYED_HEADERS = ('Location',)
+# cache backends each worker has its own of
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when retries hitting other workers would create twice"""
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        'Idempotency-Key locks and responses are kept in a cache local '
+        'to each worker process.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, '
+             'e.g. memcached.',
+        id='core.W001',
+    )]
+
+
+def request_digest(request):
+    """Digest of the request data, a key must not be reused with other data"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, default=str)
+    # keyed, the data can hold passwords
+    return hmac.new(
+        settings.SECRET_KEY.encode(), body.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """Replay the response of creates retried with the same Idempotency-Key
+
+    Goes before the DRF view classes, wrapping their create().
+    """
+
+    def idempotency_cache_key(self, request, key):
+        if request.user.is_authenticated:
+            scope = request.user.pk
+        else:
+            # the client address, as the throttles see it
+            scope = f'anon-{BaseThrottle().get_ident(request)}'
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return f'idempotency:{type(self).__name__}:{scope}:{key}'
+
+    def create(self, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response(
+                {'detail': 'Idempotency-Key must have 1 to 255 characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = self.idempotency_cache_key(request, key)
+        digest = request_digest(request)
+        replay = self.replay(cache_key, digest)
+        if replay is not None:
+            return replay
+        if not cache.add(
+            f'{cache_key}:lock', 1, settings.IDEMPOTENCY_LOCK_SECONDS
+        ):
+            return Response(
+                {'detail': 'A request with this Idempotency-Key is '
+                           'in progress.'},
+                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'}
+            )
+        try:
+            # the first request could have ended before we took the lock
+            replay = self.replay(cache_key, digest)
+            if replay is not None:
+                return replay
+            response = super().create(request, *args, **kwargs)
+            # validation errors are raised, so only successes are kept
+            if response.status_code < 500:
+                cache.set(cache_key, {
+                    'digest': digest,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {
+                        name: response[name] for name in REPLAYED_HEADERS
+                        if response.has_header(name)
+                    },
+                }, settings.IDEMPOTENCY_KEY_SECONDS)
+            return response
+        finally:
+            cache.delete(f'{cache_key}:lock')
+
+    def replay(self, cache_key, digest):
+        """Return the kept response of cache_key, or None"""
+        kept = cache.get(cache_key)
+        if kept is None:
+            return None
+        if kept['digest'] != digest:
+            return Response(
+                {'detail': 'Idempotency-Key already used for another '
+                           'request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        response = Response(
+            kept['data'], status=kept['status'], headers=kept['headers']
+        )
+        response['Idempotent-Replayed'] = 'true'
+        return response
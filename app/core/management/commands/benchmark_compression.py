@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.compression import compress, compress_chunks
+
+
+def sample_recipes(count):
+    """Return a recipe list as RecipeSerializer renders it"""
+    words = (
+        'chicken', 'curry', 'soup', 'salad', 'roast', 'spicy', 'lemon',
+        'garlic', 'tomato', 'pasta', 'quick', 'vegan', 'cake', 'bread',
+    )
+    rand = random.Random(0)
+    return [{
+        'id': pk,
+        'title': ' '.join(rand.sample(words, 3)).title(),
+        'time_minutes': rand.randint(5, 180),
+        'ingredients': sorted(rand.sample(range(1, 500), 8)),
+        'price': f'{rand.uniform(1, 99):.2f}',
+        'link': f'https://example.com/recipes/{pk}',
+        'tags': sorted(rand.sample(range(1, 60), 3)),
+    } for pk in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    """Django command to measure gzip savings and cost per level"""
+    help = 'Measure response size and compression CPU time per gzip level'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Recipes in the sample recipe list'
+        )
+        parser.add_argument(
+            '--levels', default='1,6,9',
+            help='Comma separated gzip levels'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Compressions measured per level'
+        )
+
+    def handle(self, *args, **options):
+        items = sample_recipes(options['recipes'])
+        body = JSONRenderer().render(items)
+        # streamed, one flushed chunk per recipe: the worst case
+        chunks = [JSONRenderer().render(item) for item in items]
+        self.stdout.write(
+            f'{"level":>5} {"KB":>8} {"gzip KB":>8} {"ratio":>6} '
+            f'{"cpu ms":>8} {"MB/s":>7} {"stream KB":>9}'
+        )
+        for level in options['levels'].split(','):
+            level = int(level)
+            cpu = []
+            for _ in range(options['repeat']):
+                start = time.process_time()
+                compressed = compress(body, level)
+                cpu.append(time.process_time() - start)
+            streamed = sum(map(len, compress_chunks(chunks, level)))
+            seconds = max(statistics.median(cpu), 1e-9)
+            self.stdout.write(
+                f'{level:>5} {len(body) / 1024:>8.1f} '
+                f'{len(compressed) / 1024:>8.1f} '
+                f'{len(body) / len(compressed):>6.1f} '
+                f'{seconds * 1000:>8.2f} '
+                f'{len(body) / seconds / 1024 / 1024:>7.1f} '
+                f'{streamed / 1024:>9.1f}'
+            )
@@ -0,0 +1,57 @@
+import statistics
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.compression import compress
+from core.management.commands.benchmark_compression import sample_recipes
+from core.parsers import MessagePackParser
+from core.renderers import MessagePackRenderer
+
+
+FORMATS = (
+    ('json', JSONRenderer, JSONParser),
+    ('msgpack', MessagePackRenderer, MessagePackParser),
+)
+
+
+class Command(BaseCommand):
+    """Django command to compare the JSON and MessagePack formats"""
+    help = 'Measure payload size and encode/decode time per API format'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Recipes in the sample recipe list'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Encodings and decodings measured per format'
+        )
+
+    def handle(self, *args, **options):
+        items = sample_recipes(options['recipes'])
+        self.stdout.write(
+            f'{"format":>8} {"KB":>8} {"gzip KB":>8} '
+            f'{"encode ms":>10} {"decode ms":>10}'
+        )
+        for name, renderer_class, parser_class in FORMATS:
+            renderer, parser = renderer_class(), parser_class()
+            encode, decode = [], []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                body = renderer.render(items)
+                encode.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                if parser.parse(BytesIO(body)) != items:
+                    raise RuntimeError(f'{name} round trip failed')
+                decode.append(time.perf_counter() - start)
+            self.stdout.write(
+                f'{name:>8} {len(body) / 1024:>8.1f} '
+                f'{len(compress(body, 6)) / 1024:>8.1f} '
+                f'{statistics.median(encode) * 1000:>10.2f} '
+                f'{statistics.median(decode) * 1000:>10.2f}'
+            )
@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.contrib.auth import authenticate, get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+
+class Command(BaseCommand):
+    """Django command to measure login cost at several hasher costs"""
+    help = 'Measure login latency and CPU time per PBKDF2 iteration count'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', default='60000,120000,260000',
+            help='Comma separated PBKDF2 iteration counts'
+        )
+        parser.add_argument(
+            '--logins', type=int, default=20,
+            help='Logins measured per iteration count'
+        )
+
+    def handle(self, *args, **options):
+        email, password = 'benchmark-login@example.com', 'benchmark-pass'
+        self.stdout.write(
+            f'{"iterations":>10} {"p50 ms":>8} {"p95 ms":>8} {"cpu ms":>8}'
+        )
+        # the benchmark user never outlives the command
+        with transaction.atomic():
+            for iterations in options['iterations'].split(','):
+                iterations = int(iterations)
+                with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+                    get_user_model().objects.filter(email=email).delete()
+                    get_user_model().objects.create_user(email, password)
+                    wall, cpu = self.measure(
+                        email.upper(), password, options['logins']
+                    )
+                wall.sort()
+                self.stdout.write(
+                    f'{iterations:>10} '
+                    f'{statistics.median(wall) * 1000:>8.1f} '
+                    f'{wall[int(len(wall) * 0.95)] * 1000:>8.1f} '
+                    f'{statistics.mean(cpu) * 1000:>8.1f}'
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, email, password, logins):
+        """Return wall clock and CPU seconds of each login"""
+        wall, cpu = [], []
+        for _ in range(logins):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            if authenticate(email=email, password=password) is None:
+                raise RuntimeError('Benchmark login failed')
+            wall.append(time.perf_counter() - wall_start)
+            cpu.append(time.process_time() - cpu_start)
+        return wall, cpu
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import move_user, shard_aliases, shard_for_user
+
+
+class Command(BaseCommand):
+    """Django command to move the recipe data of a user to another shard"""
+    help = 'Move the tags, ingredients and recipes of a user to a shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('shard', choices=shard_aliases())
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_id = options['user_id']
+        source = shard_for_user(user_id)
+        target = options['shard']
+        if source == target:
+            raise CommandError(f'User {user_id} is already on {target}')
+
+        self.stdout.write(f'Moving user {user_id}: {source} -> {target}')
+        moved = move_user(
+            user_id, target,
+            batch_size=options['batch_size'],
+            progress=self.report
+        )
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} rows'))
+
+    def report(self, model, count):
+        self.stdout.write(f'  {model._meta.label}: {count} rows copied')
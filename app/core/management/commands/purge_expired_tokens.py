@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """Django command to delete expired authentication tokens"""
+    help = 'Delete expired tokens in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='Seconds to pause between batches'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = AuthToken.objects.filter(expires__lte=now)
+        deleted = 0
+        while True:
+            # short transactions: each batch only locks the rows it deletes
+            keys = list(
+                expired.values_list('key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            AuthToken.objects.filter(key__in=keys).delete()
+            deleted += len(keys)
+            self.stdout.write(f'Deleted {deleted} tokens...')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{deleted} expired tokens deleted')
+        )
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.purge import purge_user
+
+
+class Command(BaseCommand):
+    """Django command to delete a user and all their data"""
+    help = 'Delete a user, by id or email, with their recipes, tags, ' \
+           'ingredients and recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='User id or email')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lookup = 'pk' if options['user'].isdigit() else 'email'
+        user = get_user_model().objects.filter(
+            **{lookup: options['user']}
+        ).first()
+        if user is None:
+            raise CommandError(f'User {options["user"]} not found')
+
+        self.stdout.write(f'Purging user {user.pk} ({user.email})...')
+        deleted = purge_user(
+            user, batch_size=options['batch_size'], progress=self.report
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} rows'))
+
+    def report(self, model, deleted):
+        self.stdout.write(f'  {model._meta.label}: {deleted} rows deleted')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core.models import UserShard
+from core.sharding import move_user, shard_aliases
+
+
+class Command(BaseCommand):
+    """Django command to even out the number of users on each shard"""
+    help = 'Move users from the fullest shards to the emptiest ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Maximum number of users to move'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        counts = dict.fromkeys(shard_aliases(), 0)
+        rows = UserShard.objects.values('alias').annotate(users=Count('pk'))
+        for row in rows:
+            if row['alias'] in counts:
+                counts[row['alias']] = row['users']
+
+        moved = []
+        while len(moved) < options['limit']:
+            fullest = max(counts, key=counts.get)
+            emptiest = min(counts, key=counts.get)
+            if counts[fullest] - counts[emptiest] <= 1:
+                break
+            # the newest users of a shard usually hold the least data
+            user_id = UserShard.objects.filter(alias=fullest).exclude(
+                user_id__in=moved
+            ).order_by('-user_id').values_list('user_id', flat=True)[0]
+            self.stdout.write(f'User {user_id}: {fullest} -> {emptiest}')
+            if not options['dry_run']:
+                move_user(
+                    user_id, emptiest, batch_size=options['batch_size']
+                )
+            counts[fullest] -= 1
+            counts[emptiest] += 1
+            moved.append(user_id)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(moved)} users moved'))
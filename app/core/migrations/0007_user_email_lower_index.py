@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_shard'),
+    ]
+
+    operations = [
+        # looked up by core.backends.EmailBackend
+        migrations.RunSQL(
+            ['CREATE INDEX core_user_email_lower_idx '
+             'ON core_user (LOWER(email))'],
+            ['DROP INDEX core_user_email_lower_idx'],
+        ),
+    ]
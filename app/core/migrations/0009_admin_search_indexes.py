@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+# columns searched by prefix in the admin (istartswith: UPPER(col) LIKE 'X%')
+SEARCHED = (
+    ('core_tag', 'name'),
+    ('core_ingredient', 'name'),
+    ('core_recipe', 'title'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    # text_pattern_ops makes LIKE prefix matches use the index on Postgres
+    ops = ''
+    if schema_editor.connection.vendor == 'postgresql':
+        ops = ' text_pattern_ops'
+    for table, column in SEARCHED:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_{column}_upper_idx '
+            f'ON {table} (UPPER({column}){ops})'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    for table, column in SEARCHED:
+        schema_editor.execute(f'DROP INDEX {table}_{column}_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_auth_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# tables searched by name for autocompletion (recipe.autocomplete)
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_indexes(apps, schema_editor):
+    postgres = schema_editor.connection.vendor == 'postgresql'
+    # prefix matches within a user: UPPER(name) LIKE 'X%'
+    ops = ' text_pattern_ops' if postgres else ''
+    for table in TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_user_name_upper_idx '
+            f'ON {table} (user_id, UPPER(name){ops})'
+        )
+    if postgres:
+        # substring matches: UPPER(name) LIKE '%X%'
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            schema_editor.execute(
+                f'CREATE INDEX {table}_name_upper_trgm_idx '
+                f'ON {table} USING gin (UPPER(name) gin_trgm_ops)'
+            )
+
+
+def drop_indexes(apps, schema_editor):
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX {table}_user_name_upper_idx')
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX {table}_name_upper_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_image_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Drop the tokens of rest_framework.authtoken, which never expired
+
+    The app is no longer installed, AuthToken replaced it.
+    """
+
+    dependencies = [
+        ('core', '0014_outbox_event'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['DROP TABLE IF EXISTS authtoken_token'],
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
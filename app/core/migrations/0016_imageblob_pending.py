@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_drop_drf_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='pending',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
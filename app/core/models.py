@@ -1,16 +1,33 @@
+import binascii
 import uuid
 import os
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser, BaseUserManager, PermissionsMixin
 )
 from django.conf import settings
 
+from core.sharding import shard_for_user
+from core.storage import ContentAddressedStorage
+from core.uploads import content_digest
+
 
 # The argument are based on what the models.ImageField needs
 def recipe_image_file_path(instance, filename):
-    """Generate file path for new recipe image"""
-    extension = filename.split('.')[-1]
+    """Generate file path for new recipe image
+
+    Uploads are named after their content, so identical images share a
+    file; the uuid is only used when the content isn't at hand.
+    """
+    extension = filename.split('.')[-1].lower()
+    image = getattr(instance, 'image', None)
+    if image and not image._committed:
+        digest = content_digest(image.file)
+        return os.path.join(
+            'upload/recipe/', digest[:2], f'{digest}.{extension}'
+        )
     filename = f'{uuid.uuid4()}.{extension}'
     
     return os.path.join('upload/recipe/', filename)
@@ -49,13 +66,139 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
 
 
+class AuthTokenManager(models.Manager):
+
+    def issue(self, user, device=''):
+        """Create a new token for user, expiring after AUTH_TOKEN_TTL"""
+        return self.create(
+            key=binascii.hexlify(os.urandom(20)).decode(),
+            user=user,
+            device=device,
+            expires=timezone.now() + settings.AUTH_TOKEN_TTL
+        )
+
+
+class AuthToken(models.Model):
+    """Expiring authentication token, a user can have one per device"""
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='auth_tokens'
+    )
+    device = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # pushed forward while the token is used (sliding expiry)
+    expires = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(null=True, db_index=True)
+
+    objects = AuthTokenManager()
+
+    def revoke(self):
+        """Revoke the token, workers notice within AUTH_TOKEN_CACHE_SECONDS"""
+        self.revoked_at = timezone.now()
+        AuthToken.objects.filter(key=self.key).update(
+            revoked_at=self.revoked_at
+        )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.device or self.key[:8]}'
+
+
+class ImageBlob(models.Model):
+    """Stored content addressed file, with the number of its references"""
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveIntegerField()
+    refs = models.PositiveIntegerField(default=0)
+    # saves whose recipe hasn't committed yet (see core.storage)
+    pending = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.refs} refs)'
+
+
+class UserShard(models.Model):
+    """Database alias (shard) holding the recipe data of a user"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    alias = models.CharField(max_length=64, db_index=True)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.alias}'
+
+
+class UserOwnedQuerySet(models.QuerySet):
+    """QuerySet for the user owned (and user sharded) models"""
+
+    def for_user(self, user):
+        """Return the rows of user, from the shard holding them"""
+        return self.using(shard_for_user(user)).filter(user=user)
+
+    def create(self, **kwargs):
+        """Create the object on the shard of its user"""
+        user = kwargs.get('user') or kwargs.get('user_id')
+        if self._db is None and user is not None:
+            return self.using(shard_for_user(user)).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class RecipeAttrQuerySet(UserOwnedQuerySet):
+    """QuerySet for the named recipe attributes (tags, ingredients)"""
+
+    def get_or_create_names(self, user, names):
+        """Return the objects of user (or user id) named names
+
+        Names match case-insensitively, the first spelling given names the
+        missing ones, which are created in a fixed number of queries however
+        many names are given. Nothing in the database keeps names unique:
+        concurrent requests can still create the same name twice, and of
+        such duplicates the oldest is used.
+        """
+        user_id = getattr(user, 'pk', user)
+        spellings = {}
+        for name in names:
+            spellings.setdefault(name.lower(), name)
+        queryset = self.for_user(user_id)
+        found = {}
+        for obj in queryset.annotate(lower_name=Lower('name')).filter(
+            lower_name__in=list(spellings)
+        ).order_by('pk'):
+            found.setdefault(obj.name.lower(), obj)
+        missing = [
+            self.model(user_id=user_id, name=name)
+            for key, name in spellings.items() if key not in found
+        ]
+        if missing:
+            created = self.using(queryset.db).bulk_create(missing)
+            if created[0].pk is None:
+                # the backend (SQLite) doesn't return the new ids
+                created = queryset.filter(
+                    name__in=[obj.name for obj in missing]
+                )
+            found.update((obj.name.lower(), obj) for obj in created)
+        return [found[key] for key in spellings]
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         # flexible dependency (best practice)
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # users live on the default database, tags on the user's shard
+        db_constraint=False
     )
+    # for incremental sync (recipe.sync)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return self.name
@@ -66,8 +209,15 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return self.name
@@ -76,7 +226,8 @@ class Ingredient(models.Model):
 class Recipe(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     title = models.CharField(max_length=255)
     time_minutes=models.IntegerField()
@@ -89,7 +240,89 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, 
-                              upload_to=recipe_image_file_path)
+                              upload_to=recipe_image_file_path,
+                              storage=ContentAddressedStorage())
+    # also bumped when the tags or ingredients of the recipe change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return self.title
+
+
+class RecipeDocument(models.Model):
+    """Recipe detail as served by the API, rendered when the recipe changes
+
+    See recipe.documents; lives on the user's shard next to the recipe.
+    """
+    recipe = models.OneToOneField(
+        'Recipe',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    body = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    def __str__(self):
+        return f'Document of recipe {self.recipe_id}'
+
+
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingredient, for incremental sync"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'])]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class OutboxEvent(models.Model):
+    """Change to deliver to integrations, written with the change itself
+
+    See recipe.outbox; delivered events are deleted.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    model = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=16)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # also leases events to a dispatcher while it delivers them
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    dead = models.BooleanField(default=False)
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['dead', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f'{self.action} {self.model} {self.object_id}'
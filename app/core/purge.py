@@ -0,0 +1,112 @@
+"""Deleting a user with all their data
+
+User.delete() collects every related row in Python (and fires signals
+for each) before deleting it. For heavy accounts purge_user() deletes
+bottom-up instead: M2M rows, then recipes, tags and ingredients, with
+batched set-based DELETEs, each in its own short transaction.
+
+The regular cascade of User.delete() only reaches the database the user
+is deleted from, so delete_shard_data() (connected to pre_delete of
+users) purges the rows on the user's shard first when it's another one.
+The cascade's signals still record tombstones and outbox events of the
+deleted rows, delete_leftover_data() (post_delete) removes them again.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Q
+
+from core import sharding
+
+
+def owned_rows(model, user_id, using):
+    """Return the rows of a sharded model belonging to user_id
+
+    M2M rows belong to the user if any of their ends does.
+    """
+    manager = model._base_manager.using(using)
+    if not model._meta.auto_created:
+        return manager.filter(user_id=user_id)
+    lookup = Q()
+    for field in model._meta.fields:
+        if field.is_relation and sharding.is_sharded(field.related_model):
+            lookup |= Q(**{f'{field.name}__user_id': user_id})
+    return manager.filter(lookup)
+
+
+def delete_in_batches(queryset, batch_size, progress=None):
+    """Delete the rows of queryset batch by batch, without signals
+
+    Files referenced by the rows are deleted from the storage afterwards.
+    Returns the number of rows deleted.
+    """
+    model = queryset.model
+    using = queryset.db
+    file_fields = [
+        field for field in model._meta.fields
+        if isinstance(field, models.FileField)
+    ]
+    deleted = 0
+    while True:
+        rows = list(
+            queryset.values_list(
+                'pk', *[field.attname for field in file_fields]
+            )[:batch_size]
+        )
+        if not rows:
+            return deleted
+        model._base_manager.using(using).filter(
+            pk__in=[row[0] for row in rows]
+        )._raw_delete(using)
+        for row in rows:
+            for field, name in zip(file_fields, row[1:]):
+                if name:
+                    # drops a reference, shared images stay
+                    field.storage.delete(name)
+        deleted += len(rows)
+        if progress:
+            progress(model, deleted)
+
+
+def purge_user_data(user_id, using, batch_size=1000, progress=None):
+    """Delete the sharded rows of user_id on shard using, returning them"""
+    deleted = 0
+    # sharded_models() lists parents first, children go first here
+    for model in reversed(sharding.sharded_models()):
+        deleted += delete_in_batches(
+            owned_rows(model, user_id, using), batch_size, progress
+        )
+    return deleted
+
+
+def purge_user(user, batch_size=1000, progress=None):
+    """Delete user and all their data, returning the rows deleted"""
+    user_id = getattr(user, 'pk', user)
+    deleted = purge_user_data(
+        user_id, sharding.shard_for_user(user_id), batch_size, progress
+    )
+
+    # what's left (tokens, shard map, admin log) is small, the regular
+    # cascade handles it
+    count, _ = get_user_model().objects.filter(pk=user_id).delete()
+    return deleted + count
+
+
+def delete_shard_data(sender, instance, using, **kwargs):
+    """Delete the data of a user being deleted from their shard"""
+    from core.models import UserShard
+
+    # no mapping (or a single database), the data is where the user is
+    shard = UserShard.objects.using(using).filter(
+        user_id=instance.pk
+    ).values_list('alias', flat=True).first()
+    if shard is not None and shard != using:
+        purge_user_data(instance.pk, shard)
+    instance._data_shard = shard or using
+    cache.delete(sharding.SHARD_CACHE_KEY.format(instance.pk))
+
+
+def delete_leftover_data(sender, instance, using, **kwargs):
+    """Delete the rows the signals of a user's deletion left behind"""
+    shard = instance.__dict__.pop('_data_shard', using)
+    purge_user_data(instance.pk, shard)
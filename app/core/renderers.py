@@ -0,0 +1,40 @@
+"""MessagePack rendering, negotiated with Accept: application/msgpack
+
+Smaller than JSON and faster to decode on phones. Values MessagePack has
+no type for are encoded the way the JSON renderer does: decimals as
+strings (no precision lost to floats), dates in ISO 8601.
+"""
+import datetime
+import decimal
+import uuid
+
+import msgpack
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+
+def encode_default(obj):
+    """Encode what msgpack can't, as DRF's JSONEncoder does"""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, Promise)):
+        return force_str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Can not encode {type(obj).__name__} as MessagePack')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render data as MessagePack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
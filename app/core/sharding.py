@@ -0,0 +1,265 @@
+"""User sharding of recipe data
+
+Tags, ingredients and recipes (and the recipe M2M tables) always belong to
+one user, so every user's rows live together on one of the database aliases
+listed in settings.SHARD_DATABASES. Users, tokens and everything else stay
+on the 'default' database, which is also the first shard.
+
+The user -> shard assignment is stored in core.models.UserShard (on
+'default') and cached, so adding a shard doesn't remap existing users; use
+the move_user_shard / rebalance_shards commands to move them. While a
+user's data moves, their writes through the models are refused with a
+503 (UserMoving).
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+
+from core.budgets import uncounted
+
+
+# models whose rows are placed on the owner's shard; M2M through tables
+# follow the model declaring the relation
+SHARDED_MODELS = (
+    'core.Tag',
+    'core.Ingredient',
+    'core.Recipe',
+    'core.RecipeDocument',
+    'core.Tombstone',
+    'core.OutboxEvent',
+)
+
+SHARD_CACHE_KEY = 'user-shard:{}'
+SHARD_CACHE_TIMEOUT = 60 * 60
+# set while the data of the user moves, their writes wait for the end
+MOVING_KEY = 'user-moving:{}'
+
+
+class UserMoving(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Your data is being moved, retry in a moment.')
+    default_code = 'user_moving'
+
+
+def shard_aliases():
+    """Return the database aliases used as shards"""
+    return getattr(settings, 'SHARD_DATABASES', [DEFAULT_DB_ALIAS])
+
+
+def is_sharded(model):
+    """Tell if the rows of the model are placed by user shard"""
+    # auto created M2M through models point at the model owning the field
+    owner = model._meta.auto_created or model
+    return owner._meta.label in SHARDED_MODELS
+
+
+def sharded_models():
+    """Return sharded models (through tables included), parents first"""
+    labels = {label: i for i, label in enumerate(SHARDED_MODELS)}
+    found = [
+        model for model in apps.get_models(include_auto_created=True)
+        if is_sharded(model)
+    ]
+    return sorted(found, key=lambda model: (
+        labels[(model._meta.auto_created or model)._meta.label],
+        bool(model._meta.auto_created)
+    ))
+
+
+def owner_filter(model, user_id):
+    """Return the lookup selecting the rows of a sharded model for a user"""
+    if model._meta.auto_created:
+        # through tables are reached through the owning model ('recipe')
+        owner_field = model._meta.auto_created._meta.model_name
+        return {f'{owner_field}__user_id': user_id}
+    return {'user_id': user_id}
+
+
+def _user_id(user):
+    return user if isinstance(user, int) else user.pk
+
+
+def shard_for_user(user):
+    """Return the database alias holding the data of user (or user id)"""
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    user_id = _user_id(user)
+    key = SHARD_CACHE_KEY.format(user_id)
+    alias = cache.get(key)
+    if alias is None:
+        from core.models import UserShard
+        # once per user and cache timeout, not part of the views' work
+        with uncounted():
+            shard, _ = UserShard.objects.get_or_create(
+                user_id=user_id,
+                defaults={'alias': aliases[user_id % len(aliases)]}
+            )
+        alias = shard.alias
+        cache.set(key, alias, SHARD_CACHE_TIMEOUT)
+    return alias
+
+
+def check_writable(user_id):
+    """Raise UserMoving if the data of user_id is being moved"""
+    if user_id is None or len(shard_aliases()) == 1:
+        return
+    if cache.get(MOVING_KEY.format(user_id)):
+        raise UserMoving()
+
+
+def refuse_moving_writes(sender, instance, action='pre', **kwargs):
+    """pre_save, pre_delete and m2m_changed receiver: check_writable()"""
+    if action.startswith('pre') and is_sharded(sender):
+        check_writable(getattr(instance, 'user_id', None))
+
+
+def reserve_id_range(alias):
+    """Make the sharded tables of alias allocate ids in their own block
+
+    Shard number k hands out ids from k * SHARD_ID_BLOCK on, so ids stay
+    unique across shards and rows keep their primary key when moved.
+    """
+    aliases = shard_aliases()
+    if alias not in aliases or aliases.index(alias) == 0:
+        return
+    start = aliases.index(alias) * settings.SHARD_ID_BLOCK
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                    'GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {})))'
+                    .format(connection.ops.quote_name(table)),
+                    [table, 'id', start]
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                    'WHERE name = %s', [start, table]
+                )
+                if not cursor.rowcount:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) '
+                        'VALUES (%s, %s)', [table, start]
+                    )
+
+
+def copy_rows(models_, user_id, source, target, batch_size, progress):
+    """Copy the rows of user_id from source to target, returning them"""
+    copied = 0
+    for model in models_:
+        queryset = model._base_manager.using(source).filter(
+            **owner_filter(model, user_id)
+        ).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic(using=target):
+                model._base_manager.using(target).bulk_create(batch)
+            last_pk = batch[-1].pk
+            copied += len(batch)
+            if progress:
+                progress(model, len(batch))
+    return copied
+
+
+def move_user(user, target, batch_size=1000, progress=None):
+    """Move all the sharded rows of user to the target shard
+
+    The user's writes are refused from the start (check_writable), and
+    the ones already running get SHARD_MOVE_GRACE_SECONDS to commit. Rows
+    are then copied in primary key batches, the shard map is switched,
+    writes are let through again, and the source rows are removed in
+    batches. Returns the number of rows moved.
+    """
+    from core.models import UserShard
+
+    if target not in shard_aliases():
+        raise ValueError(f'Unknown shard {target}')
+    user_id = _user_id(user)
+    source = shard_for_user(user_id)
+    if source == target:
+        return 0
+
+    models_ = sharded_models()
+    moving_key = MOVING_KEY.format(user_id)
+    cache.set(moving_key, target, None)
+    try:
+        time.sleep(settings.SHARD_MOVE_GRACE_SECONDS)
+        moved = copy_rows(models_, user_id, source, target, batch_size,
+                          progress)
+        UserShard.objects.update_or_create(
+            user_id=user_id, defaults={'alias': target}
+        )
+        cache.delete(SHARD_CACHE_KEY.format(user_id))
+    finally:
+        cache.delete(moving_key)
+
+    # children first, so nothing points at deleted rows in the meantime
+    for model in reversed(models_):
+        queryset = model._base_manager.using(source).filter(
+            **owner_filter(model, user_id)
+        )
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            model._base_manager.using(source).filter(
+                pk__in=ids
+            )._raw_delete(source)
+    return moved
+
+
+class UserShardRouter:
+    """Route sharded models to the shard of their owner
+
+    Querysets have no owner to route by, so sharded reads go through
+    UserOwnedQuerySet.for_user(); saves are routed by the instance's user.
+    Every shard gets the full schema (migrate --database=<alias>), the
+    tables not sharded just stay empty there.
+    """
+
+    def _db_for_instance(self, instance):
+        if instance is None:
+            return None
+        if isinstance(instance, get_user_model()):
+            # assigning the owner, e.g. Tag(user=user)
+            return shard_for_user(instance) if instance.pk else None
+        if instance._state.db:
+            return instance._state.db
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is None:
+            return None
+        return shard_for_user(user_id)
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if not is_sharded(model):
+            # related lookups (e.g. recipe.user) must not follow the
+            # instance onto its shard
+            if instance is not None and is_sharded(type(instance)):
+                return DEFAULT_DB_ALIAS
+            return None
+        return self._db_for_instance(instance)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
@@ -0,0 +1,97 @@
+"""Storage of content addressed, reference counted files
+
+Recipe images are named after the SHA-256 of their content, so uploading
+a photo that is already stored only adds a reference to it, without
+writing anything. References are counted in core.models.ImageBlob (on
+the 'default' database): delete() drops one, the file going away with its
+last reference.
+
+A save only marks the file pending; the recipe saved with it takes the
+reference (take_reference(), from recipe.signals) when its shard
+transaction commits, so a rolled back recipe leaves no reference behind.
+Files with saves pending aren't deleted with their last reference, the
+recipes referencing them may still commit; if they don't,
+gc_recipe_images removes the file.
+"""
+import os
+import threading
+import uuid
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+# names saved by this thread, until a recipe takes their reference
+saved = threading.local()
+
+
+def take_reference(name, using):
+    """Count the reference of a recipe saved with file name, on commit
+
+    Only for a file just saved by the storage, in this thread; the
+    transaction is the recipe's, on its shard using.
+    """
+    names = saved.__dict__.setdefault('names', Counter())
+    if not names[name]:
+        return
+    names[name] -= 1
+    if not names[name]:
+        del names[name]
+
+    from core.models import ImageBlob
+
+    def add():
+        ImageBlob.objects.filter(name=name).update(
+            refs=F('refs') + 1, pending=F('pending') - 1
+        )
+    transaction.on_commit(add, using=using)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # a name taken holds the same content
+        return name
+
+    def _save(self, name, content):
+        from core.models import ImageBlob
+
+        # the row lock serializes saves and deletes of the same content
+        with transaction.atomic():
+            blob, _ = ImageBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': content.size}
+            )
+            if self.exists(name):
+                # fresh again, for gc_recipe_images' grace period
+                os.utime(self.path(name))
+            else:
+                # written aside and renamed, readers never see part of it
+                partial = super()._save(
+                    f'{name}.{uuid.uuid4().hex}.part', content
+                )
+                os.replace(self.path(partial), self.path(name))
+            ImageBlob.objects.filter(pk=blob.pk).update(
+                pending=F('pending') + 1
+            )
+        saved.__dict__.setdefault('names', Counter())[name] += 1
+        return name
+
+    def delete(self, name):
+        from core.models import ImageBlob
+
+        with transaction.atomic():
+            blob = ImageBlob.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if blob is not None and (blob.refs > 1 or blob.pending):
+                ImageBlob.objects.filter(pk=blob.pk, refs__gt=0).update(
+                    refs=F('refs') - 1
+                )
+                return
+            # last reference, or a file stored before reference counting
+            ImageBlob.objects.filter(name=name).delete()
+            super().delete(name)
@@ -1,7 +1,17 @@
-from django.test import TestCase, Client
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 
+from core.admin import EstimatedCountPaginator
+from core.models import Recipe, Tag, UserShard
+from core.tests.utils import TestCase
+
 
 class AdminSiteTests(TestCase):
     def setUp(self):
@@ -38,3 +48,109 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+
+class RecipeAdminTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@admin.com',
+            password='1234'
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='user@test.com',
+            password='1234'
+        )
+
+    def sample_recipe(self, title='Carrot Cake'):
+        return Recipe.objects.create(
+            user=self.user, title=title, time_minutes=10, price=5
+        )
+
+    def test_recipe_changelist_queries(self):
+        """Test that the recipe list doesn't query per row"""
+        self.sample_recipe()
+        url = reverse('admin:core_recipe_changelist')
+        with CaptureQueriesContext(connection) as one_row:
+            self.client.get(url)
+        for i in range(10):
+            self.sample_recipe(title=f'Recipe {i}')
+        with CaptureQueriesContext(connection) as many_rows:
+            res = self.client.get(url)
+
+        self.assertContains(res, 'Recipe 9')
+        self.assertEqual(len(one_row), len(many_rows))
+
+    def test_recipe_change_page_autocomplete(self):
+        """Test that the change page doesn't list every tag"""
+        recipe = self.sample_recipe()
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Used'))
+        Tag.objects.create(user=self.user, name='Unused')
+
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertContains(res, 'Used')
+        self.assertNotContains(res, 'Unused')
+
+    def test_tag_search(self):
+        """Test searching tags by name prefix"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(
+            reverse('admin:core_tag_changelist'), {'q': 'veg'}
+        )
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Dessert')
+
+    def test_estimated_count_paginator(self):
+        """Test that the paginator counts rows where it can't estimate"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, 1)
+
+
+@skipUnless(
+    'shard1' in settings.SHARD_DATABASES,
+    'run with DB_SHARDS=shard1 to test the admin across shards'
+)
+class ShardedAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        admin_user = get_user_model().objects.create_superuser(
+            email='admin@admin.com',
+            password='1234'
+        )
+        self.client.force_login(admin_user)
+        user = get_user_model().objects.create_user(
+            email='user@test.com',
+            password='1234'
+        )
+        UserShard.objects.create(user=user, alias='shard1')
+        self.recipe = Recipe.objects.create(
+            user=user, title='Carrot Cake', time_minutes=10, price=5
+        )
+        self.recipe.tags.add(Tag.objects.create(user=user, name='Sweet'))
+
+    def test_shard_changelist(self):
+        """Test listing the recipes of another shard"""
+        url = reverse('admin:core_recipe_changelist')
+        self.assertNotContains(self.client.get(url), 'Carrot Cake')
+
+        res = self.client.get(url, {'shard': 'shard1'})
+
+        self.assertContains(res, 'Carrot Cake')
+        self.assertContains(res, 'user@test.com')
+
+    def test_shard_change_page(self):
+        """Test opening a recipe of another shard"""
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[self.recipe.id])
+        )
+
+        self.assertContains(res, 'Carrot Cake')
+        self.assertContains(res, 'Sweet')
@@ -0,0 +1,65 @@
+from io import StringIO
+
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.tests.utils import TestCase
+
+
+TOKEN_URL = reverse('user:token')
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class EmailBackendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'Someone@Test.com', 'pass1234'
+        )
+
+    def test_email_case_insensitive(self):
+        """Test that logging in doesn't depend on the email case"""
+        user = authenticate(email='SOMEONE@test.COM', password='pass1234')
+        self.assertEqual(user, self.user)
+        self.assertIsNone(
+            authenticate(email='someone@test.com', password='wrong')
+        )
+        self.assertIsNone(
+            authenticate(email='nobody@test.com', password='pass1234')
+        )
+
+    def test_token_case_insensitive(self):
+        """Test getting a token with the email in another case"""
+        res = APIClient().post(
+            TOKEN_URL, {'email': 'someone@TEST.com', 'password': 'pass1234'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+
+    def test_rehash_when_cost_changes(self):
+        """Test that passwords are rehashed at the new cost on login"""
+        self.assertIn('$1000$', self.user.password)
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            authenticate(email='someone@test.com', password='pass1234')
+
+        self.user.refresh_from_db()
+        self.assertIn('$2000$', self.user.password)
+        self.assertTrue(self.user.check_password('pass1234'))
+
+    def test_benchmark_login(self):
+        """Test the login benchmark reports each cost, leaving no user"""
+        out = StringIO()
+        call_command(
+            'benchmark_login', iterations='1000,2000', logins=2, stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].strip().startswith('2000'))
+        self.assertEqual(get_user_model().objects.count(), 1)
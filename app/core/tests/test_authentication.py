@@ -0,0 +1,129 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.authentication import revoked_tokens, token_cache
+from core.models import AuthToken
+from core.tests.utils import TestCase
+
+
+TOKEN_URL = reverse('user:token')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class ExpiringTokenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        revoked_tokens.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+
+    def login(self, device=''):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@test.com', 'password': 'pass1234', 'device': device
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['token']
+
+    def get_me(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return self.client.get(ME_URL)
+
+    def test_token_per_device(self):
+        """Test that each login gets its own token"""
+        phone, laptop = self.login('phone'), self.login('laptop')
+
+        self.assertNotEqual(phone, laptop)
+        self.assertEqual(self.get_me(phone).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_me(laptop).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(self.user.auth_tokens.values_list('device', flat=True)),
+            {'phone', 'laptop'}
+        )
+
+    def test_expired_token_rejected(self):
+        """Test that expired tokens don't authenticate"""
+        key = self.login()
+        AuthToken.objects.filter(key=key).update(
+            expires=timezone.now() - timedelta(seconds=1)
+        )
+        res = self.get_me(key)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sliding_expiry(self):
+        """Test that using a token pushes its expiry forward"""
+        key = self.login()
+        soon = timezone.now() + timedelta(days=1)
+        AuthToken.objects.filter(key=key).update(expires=soon)
+
+        self.assertEqual(self.get_me(key).status_code, status.HTTP_200_OK)
+        self.assertGreater(AuthToken.objects.get(key=key).expires, soon)
+
+    def test_cached_token_no_queries(self):
+        """Test that recently used tokens are authenticated from memory"""
+        key = self.login()
+        self.get_me(key)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_me(key).status_code, status.HTTP_200_OK)
+
+    def test_revoke_token(self):
+        """Test that revoked tokens are rejected, even when cached"""
+        key, other = self.login(), self.login()
+        self.get_me(key)
+
+        res = self.client.post(REVOKE_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = self.get_me(key)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_me(other).status_code, status.HTTP_200_OK)
+
+    def test_revocation_set_refresh(self):
+        """Test that revocations by other workers are picked up"""
+        key = self.login()
+        self.get_me(key)
+        AuthToken.objects.get(key=key).revoke()
+
+        # as if AUTH_TOKEN_CACHE_SECONDS went by
+        revoked_tokens.refreshed_at -= timedelta(minutes=1)
+        self.assertIn(key, revoked_tokens)
+
+    def test_late_revocation_refresh(self):
+        """Test revocations committed after a refresh are still picked up"""
+        key = self.login()
+        self.get_me(key)
+        # committed only now, though made before the last refresh
+        AuthToken.objects.filter(key=key).update(
+            revoked_at=timezone.now() - timedelta(seconds=20)
+        )
+
+        revoked_tokens.refreshed_at -= timedelta(minutes=1)
+        self.assertIn(key, revoked_tokens)
+
+    def test_purge_expired_tokens(self):
+        """Test deleting expired tokens in batches"""
+        for _ in range(3):
+            AuthToken.objects.issue(self.user)
+        valid = AuthToken.objects.issue(self.user)
+        AuthToken.objects.exclude(key=valid.key).update(
+            expires=timezone.now() - timedelta(days=1)
+        )
+
+        call_command(
+            'purge_expired_tokens', batch_size=2, sleep=0, stdout=StringIO()
+        )
+
+        self.assertEqual(list(AuthToken.objects.all()), [valid])
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import resolve, reverse
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.budgets import (
+    QueryBudgetExceeded, QueryCounter, fingerprint, view_budget
+)
+from core.models import Recipe, UserShard
+from core.tests.utils import TestCase
+from recipe.views import RecipeViewSet
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+
+    def test_fingerprint(self):
+        """Test that queries differing in their values look the same"""
+        self.assertEqual(
+            fingerprint('SELECT 1 FROM "t" WHERE a IN (%s, %s) LIMIT 21'),
+            fingerprint("SELECT 2 FROM \"t\" WHERE a IN (%s) LIMIT 'x'")
+            .replace('(%s)', '(...)'),
+        )
+        self.assertEqual(
+            fingerprint('SELECT "shard1" WHERE b IN (%s, %s, %s)'),
+            'SELECT "shard1" WHERE b IN (...)'
+        )
+
+    @override_settings(QUERY_BUDGETS='raise')
+    def test_over_budget_raises(self):
+        """Test that going over the budget fails, listing the queries"""
+        with mock.patch.object(RecipeViewSet, 'query_budgets', {'list': 1}):
+            with self.assertRaises(QueryBudgetExceeded) as error:
+                self.client.get(RECIPE_URL)
+        self.assertIn('over its budget of 1', str(error.exception))
+        self.assertIn('"core_recipe"', str(error.exception))
+
+    @override_settings(QUERY_BUDGETS='log')
+    def test_over_budget_logged(self):
+        """Test that in 'log' mode the request goes on, with a warning"""
+        with mock.patch.object(RecipeViewSet, 'query_budgets', {'list': 1}):
+            with self.assertLogs('core.budgets', 'WARNING'):
+                res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(
+        QUERY_BUDGETS='raise', SHARD_DATABASES=['default', 'shard1']
+    )
+    def test_shard_lookups_uncounted(self):
+        """Test that looking up users' shards doesn't count"""
+        # where setUp put the recipe, when not sharded
+        UserShard.objects.get_or_create(
+            user=self.user, defaults={'alias': 'default'}
+        )
+        cache.clear()
+        with QueryCounter() as counter:
+            sharding.shard_for_user(self.user)
+        self.assertEqual(len(counter), 0)
+
+        cache.clear()
+        res = self.client.get(
+            reverse('recipe:recipe-detail', args=[self.recipe.id])
+        )
+        self.assertEqual(res.status_code, 200)
+
+    def test_view_budget(self):
+        """Test finding the budgets of actions"""
+        recipe = self.recipe
+        for url, method, budget in (
+            (RECIPE_URL, 'get', 5),
+            (RECIPE_URL, 'post', None),
+            (reverse('recipe:recipe-similar', args=[recipe.id]), 'get', 9),
+            (reverse('recipe:tag-list'), 'head', 3),
+        ):
+            self.assertEqual(
+                view_budget(resolve(url).func, method), budget, (url, method)
+            )
@@ -2,7 +2,8 @@ from unittest.mock import patch
 
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import TestCase
+
+from core.tests.utils import TestCase
 
 
 class CommandTests(TestCase):
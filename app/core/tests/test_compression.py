@@ -0,0 +1,131 @@
+import gzip
+import json
+import zlib
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import compression
+from core.compression import CompressionMiddleware, accepts_gzip
+from core.models import Recipe
+from core.tests.utils import TestCase
+
+
+BODY = json.dumps([{'title': f'Recipe {i}'} for i in range(200)]).encode()
+
+
+@override_settings(GZIP_MIN_LENGTH=1024)
+class CompressionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def respond(self, response, **headers):
+        headers.setdefault('HTTP_ACCEPT_ENCODING', 'gzip, deflate')
+        request = self.factory.get('/api/recipe/recipes/', **headers)
+        self.request = request
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_accepts_gzip(self):
+        """Test reading Accept-Encoding, q-values included"""
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('br;q=1.0, *;q=0.5'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip('identity'))
+        self.assertFalse(accepts_gzip(''))
+
+    def test_compressed(self):
+        """Test that large JSON bodies are compressed"""
+        res = self.respond(HttpResponse(BODY, 'application/json'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertLess(len(res.content), len(BODY) / 4)
+        self.assertEqual(gzip.decompress(res.content), BODY)
+
+    def test_not_compressed(self):
+        """Test small, binary, partial and unwanted bodies are left alone"""
+        for response, headers in (
+            (HttpResponse(b'{}', 'application/json'), {}),
+            (HttpResponse(BODY, 'image/jpeg'), {}),
+            (HttpResponse(BODY, 'application/json', status=206), {}),
+            (HttpResponse(BODY, 'application/json'),
+             {'HTTP_ACCEPT_ENCODING': 'gzip;q=0'}),
+        ):
+            res = self.respond(response, **headers)
+            self.assertFalse(res.has_header('Content-Encoding'))
+            self.assertEqual(res.content, response.content)
+
+    def test_streaming_chunks(self):
+        """Test that each streamed chunk can be decompressed on arrival"""
+        chunks = [b'event: tag\ndata: {"ids": [%d]}\n\n' % i for i in range(3)]
+        res = self.respond(StreamingHttpResponse(
+            iter(chunks), content_type='text/event-stream'
+        ))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        stream = iter(res.streaming_content)
+        for chunk in chunks:
+            self.assertEqual(decompressor.decompress(next(stream)), chunk)
+
+    def test_etags(self):
+        """Test ETags are weakened, and weak If-None-Match still matches"""
+        response = HttpResponse(BODY, 'application/json')
+        response['ETag'] = '"v1"'
+        res = self.respond(response, HTTP_IF_NONE_MATCH='W/"v1"')
+
+        self.assertEqual(res['ETag'], 'W/"v1"')
+        self.assertEqual(self.request.META['HTTP_IF_NONE_MATCH'], '"v1"')
+
+    def test_compressed_cache(self):
+        """Test that bodies with a strong ETag are compressed once"""
+        def respond():
+            response = HttpResponse(BODY, 'application/json')
+            response['ETag'] = '"v1"'
+            return self.respond(response)
+
+        with mock.patch.object(
+            compression, 'compress', wraps=compression.compress
+        ) as compress:
+            first, second = respond(), respond()
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first.content, second.content)
+
+    def test_recipe_list(self):
+        """Test the recipe list through the whole stack"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        for i in range(30):
+            Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=10, price=5
+            )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(
+            reverse('recipe:recipe-list'), HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(res.content))), 30)
+
+    def test_benchmark_compression(self):
+        """Test the benchmark reports each level"""
+        out = StringIO()
+        call_command(
+            'benchmark_compression', recipes=50, levels='1,9', repeat=1,
+            stdout=out
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].strip().startswith('9'))
@@ -0,0 +1,95 @@
+from decimal import Decimal
+from io import StringIO
+
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.renderers import MessagePackRenderer
+from core.tests.utils import TestCase
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+MSGPACK = 'application/msgpack'
+
+
+class MessagePackTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_decimals_lossless(self):
+        """Test that decimals keep all their digits"""
+        body = MessagePackRenderer().render(
+            {'price': Decimal('0.10'), 'big': Decimal('12345678901234.56789')}
+        )
+        self.assertEqual(
+            msgpack.unpackb(body, raw=False),
+            {'price': '0.10', 'big': '12345678901234.56789'}
+        )
+
+    def test_create_and_list(self):
+        """Test sending and receiving recipes as MessagePack"""
+        res = self.client.post(RECIPE_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '5.25',
+            'tag_names': ['Quick'],
+        }, format='msgpack', HTTP_ACCEPT=MSGPACK)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Content-Type'], MSGPACK)
+
+        res = self.client.get(RECIPE_URL, HTTP_ACCEPT=MSGPACK)
+        recipes = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual(recipes[0]['title'], 'Soup')
+        self.assertEqual(recipes[0]['price'], '5.25')
+        self.assertEqual(len(recipes[0]['tags']), 1)
+
+    def test_json_stays_default(self):
+        """Test that clients not asking for MessagePack get JSON"""
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res['Content-Type'], 'application/json')
+
+    @override_settings(RECIPE_DOCUMENTS=True)
+    def test_retrieve_document(self):
+        """Test that stored JSON documents aren't sent for MessagePack"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price='7.00'
+        )
+        res = self.client.get(
+            reverse('recipe:recipe-detail', args=[recipe.id]),
+            HTTP_ACCEPT=MSGPACK
+        )
+        self.assertEqual(res['Content-Type'], MSGPACK)
+        self.assertEqual(
+            msgpack.unpackb(res.content, raw=False)['title'], 'Curry'
+        )
+
+    def test_invalid_body(self):
+        """Test that a malformed body is a bad request"""
+        res = self.client.post(
+            RECIPE_URL, b'\xc1', content_type=MSGPACK
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sign_up(self):
+        """Test the users endpoints take MessagePack too"""
+        res = APIClient().post(reverse('user:create'), {
+            'email': 'new@test.com', 'password': 'pass1234', 'name': 'New'
+        }, format='msgpack')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_benchmark_formats(self):
+        """Test the benchmark reports each format"""
+        out = StringIO()
+        call_command('benchmark_formats', recipes=20, repeat=1, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].strip().startswith('msgpack'))
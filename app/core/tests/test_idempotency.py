@@ -0,0 +1,120 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import checks
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import mixins, status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.utils import TestCase
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+CREATE_USER_URL = reverse('user:create')
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {'title': 'Soup', 'time_minutes': 5, 'price': '5.00'}
+
+    def post(self, url, payload, key='key-1'):
+        return self.client.post(
+            url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replayed(self):
+        """Test that a retried create returns the first response"""
+        first = self.post(RECIPE_URL, self.payload)
+        retry = self.post(RECIPE_URL, self.payload)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+        self.post(RECIPE_URL, self.payload, key='key-2')
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 2)
+
+    def test_keys_scoped(self):
+        """Test that keys are per user and per endpoint"""
+        self.post(TAG_URL, {'name': 'Vegan'})
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        self.client.force_authenticate(other)
+        res = self.post(TAG_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        res = self.post(RECIPE_URL, self.payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        for user in (self.user, other):
+            self.assertEqual(Tag.objects.for_user(user).count(), 1)
+
+    def test_key_reused_other_request(self):
+        """Test that a key can't be reused with other data"""
+        self.post(RECIPE_URL, self.payload)
+        res = self.post(RECIPE_URL, dict(self.payload, title='Stew'))
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_concurrent_duplicate(self):
+        """Test that a duplicate of a running request is turned away"""
+        def create_during_retry(view, request, *args, **kwargs):
+            retry = self.post(RECIPE_URL, self.payload)
+            self.assertEqual(retry.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(retry['Retry-After'], '1')
+            return create(view, request, *args, **kwargs)
+
+        create = mixins.CreateModelMixin.create
+        with mock.patch.object(
+            mixins.CreateModelMixin, 'create', create_during_retry
+        ):
+            res = self.post(RECIPE_URL, self.payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+
+    def test_invalid_request_not_kept(self):
+        """Test that a retry after a validation error runs again"""
+        res = self.post(RECIPE_URL, {'title': 'Soup'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.post(RECIPE_URL, {'title': 'Soup'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('Idempotent-Replayed', res)
+
+    def test_create_user_replayed(self):
+        """Test that anonymous sign ups are replayed too"""
+        client = APIClient()
+        payload = {
+            'email': 'new@test.com', 'password': 'pass1234', 'name': 'New'
+        }
+        for _ in range(2):
+            res = client.post(
+                CREATE_USER_URL, payload, HTTP_IDEMPOTENCY_KEY='signup'
+            )
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Idempotent-Replayed'], 'true')
+
+    def test_local_cache_warned(self):
+        """Test a cache local to the worker is warned about"""
+        def cache_warnings(backend):
+            caches = {'default': {'BACKEND': backend}}
+            with override_settings(CACHES=caches):
+                messages = checks.run_checks(tags=[checks.Tags.caches])
+            return [message.id for message in messages]
+
+        self.assertEqual(
+            cache_warnings('django.core.cache.backends.locmem.LocMemCache'),
+            ['core.W001']
+        )
+        self.assertEqual(cache_warnings(
+            'django.core.cache.backends.memcached.MemcachedCache'
+        ), [])
@@ -0,0 +1,65 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.urls import reverse
+
+from core.tests.utils import TempMediaMixin, TestCase
+
+
+class MediaServingTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        self.name = default_storage.save(
+            'test/media.txt', ContentFile(b'0123456789')
+        )
+        self.url = reverse('media', args=[self.name])
+
+    def tearDown(self):
+        default_storage.delete(self.name)
+
+    def test_serve_file(self):
+        """Test files are served with cache headers"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Length'], '10')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+
+    def test_range(self):
+        """Test byte range requests"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(res.status_code, 416)
+
+        res = self.client.get(
+            self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(MEDIA_ACCEL='nginx')
+    def test_accel_redirect(self):
+        """Test the transfer is left to nginx"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected-media/{self.name}'
+        )
+        self.assertEqual(res.content, b'')
+
+    def test_outside_media_root(self):
+        """Test paths can't leave MEDIA_ROOT"""
+        res = self.client.get(reverse('media', args=['../etc/passwd']))
+        self.assertEqual(res.status_code, 404)
@@ -1,6 +1,5 @@
 from unittest.mock import patch
 
-from django.test import TestCase
 # use get_user_model instead of importing User model directly
 # in this way, if you modify what the user model is,
 # the function get_user_model will still work correctly
@@ -8,6 +7,7 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 
 from core import models
+from core.tests.utils import TestCase
 
 
 def sample_user(email='test@test.com', password='123456'):
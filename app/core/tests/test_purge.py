@@ -0,0 +1,80 @@
+import os
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import override_settings
+
+from core.models import Ingredient, OutboxEvent, Recipe, Tag, Tombstone
+from core.sharding import shard_aliases, shard_for_user
+from core.tests.utils import TempMediaMixin, TransactionTestCase
+
+
+def sample_data(user, count=3):
+    """Create recipes with tags and ingredients for user"""
+    tags = [Tag.objects.create(user=user, name=f'Tag {i}')
+            for i in range(count)]
+    ingredients = [Ingredient.objects.create(user=user, name=f'Ing {i}')
+                   for i in range(count)]
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user, title=f'Recipe {i}', time_minutes=10, price=5
+        )
+        recipe.tags.set(tags)
+        recipe.ingredients.set(ingredients)
+        recipes.append(recipe)
+    return recipes
+
+
+class PurgeUserTests(TempMediaMixin, TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'heavy@test.com', 'pass1234'
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@test.com', 'pass1234'
+        )
+        self.recipes = sample_data(self.user)
+        sample_data(self.other, count=1)
+
+    def test_purge_user(self):
+        """Test that purging removes the user's data only"""
+        recipe = self.recipes[0]
+        recipe.image.save('photo.jpg', ContentFile(b'jpeg'))
+        path = recipe.image.path
+
+        shard = shard_for_user(self.user)
+        out = StringIO()
+        call_command('purge_user', self.user.email, batch_size=2, stdout=out)
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        for model in (Recipe, Tag, Ingredient):
+            self.assertFalse(model.objects.using(shard).filter(
+                user_id=self.user.pk
+            ).exists())
+            self.assertEqual(model.objects.for_user(self.other).count(), 1)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            self.assertEqual(sum(
+                through.objects.using(alias).count()
+                for alias in shard_aliases()
+            ), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertIn('core.Recipe: 3 rows deleted', out.getvalue())
+
+    @override_settings(OUTBOX_WEBHOOK_URL='http://hooks.test/')
+    def test_delete_user_no_leftovers(self):
+        """Test the cascade of a user delete leaves no rows behind"""
+        user_id, shard = self.user.pk, shard_for_user(self.user)
+        self.user.delete()
+
+        for model in (Recipe, Tag, Tombstone, OutboxEvent):
+            self.assertFalse(model.objects.using(shard).filter(
+                user_id=user_id
+            ).exists())
@@ -0,0 +1,171 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.models import Recipe, Tag, UserShard
+from core.tests.utils import TestCase
+
+
+TWO_SHARDS = ['default', 'shard1']
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_user(email='test@test.com', password='123456'):
+    return get_user_model().objects.create_user(email, password)
+
+
+class ShardMapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = sample_user()
+
+    @override_settings(SHARD_DATABASES=['default'])
+    def test_single_shard_no_queries(self):
+        """Test that a single database needs no shard lookups"""
+        with self.assertNumQueries(0):
+            self.assertEqual(sharding.shard_for_user(self.user), 'default')
+
+    @override_settings(SHARD_DATABASES=TWO_SHARDS)
+    def test_user_assigned_and_persisted(self):
+        """Test that users get a shard, which is stored in the shard map"""
+        alias = sharding.shard_for_user(self.user)
+        self.assertEqual(alias, TWO_SHARDS[self.user.id % 2])
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, alias)
+
+        # the assignment doesn't change when shards are added
+        with override_settings(SHARD_DATABASES=TWO_SHARDS + ['shard2']):
+            cache.clear()
+            self.assertEqual(sharding.shard_for_user(self.user), alias)
+
+    @override_settings(SHARD_DATABASES=TWO_SHARDS)
+    def test_shard_cached(self):
+        """Test that the shard map is read once per user"""
+        sharding.shard_for_user(self.user.id)
+        with self.assertNumQueries(0):
+            sharding.shard_for_user(self.user.id)
+
+    @override_settings(SHARD_DATABASES=TWO_SHARDS)
+    def test_router(self):
+        """Test routing objects by the shard of their user"""
+        UserShard.objects.create(user=self.user, alias='shard1')
+        router = sharding.UserShardRouter()
+        tag = Tag(user=self.user, name='Vegan')
+
+        self.assertEqual(router.db_for_write(Tag, instance=tag), 'shard1')
+        self.assertEqual(
+            router.db_for_read(Recipe.tags.through, instance=Recipe(
+                user=self.user
+            )),
+            'shard1'
+        )
+        self.assertIsNone(router.db_for_read(Tag))
+        # users stay on the default database
+        self.assertEqual(
+            router.db_for_read(get_user_model(), instance=tag), 'default'
+        )
+
+    def test_sharded_models(self):
+        """Test that recipe M2M tables follow recipes"""
+        models = sharding.sharded_models()
+        self.assertIn(Recipe.tags.through, models)
+        self.assertLess(models.index(Recipe), models.index(
+            Recipe.ingredients.through
+        ))
+        self.assertNotIn(get_user_model(), models)
+
+
+@skipUnless(
+    'shard1' in settings.SHARD_DATABASES,
+    'run with DB_SHARDS=shard1 to test moves'
+)
+@override_settings(SHARD_MOVE_GRACE_SECONDS=0)
+class MoveUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = sample_user()
+        UserShard.objects.create(user=self.user, alias='default')
+
+    def test_move_user(self):
+        """Test moving the data of a user to another shard"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=3
+        )
+        recipe.tags.add(tag)
+
+        call_command('move_user_shard', self.user.id, 'shard1',
+                     '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(sharding.shard_for_user(self.user), 'shard1')
+        self.assertFalse(Recipe.objects.using('default').exists())
+        moved = Recipe.objects.for_user(self.user).get()
+        self.assertEqual(moved.pk, recipe.pk)
+        self.assertEqual(list(moved.tags.all()), [tag])
+
+    def test_writes_refused_while_moving(self):
+        """Test the user can't write while their data is copied"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        responses = []
+
+        def write(model, count):
+            with self.assertRaises(sharding.UserMoving):
+                Tag.objects.create(user=self.user, name='Quick')
+            responses.append(client.post(TAGS_URL, {'name': 'Quick'}))
+
+        sharding.move_user(self.user, 'shard1', progress=write)
+
+        self.assertEqual(
+            responses[0].status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(
+            [tag.name for tag in Tag.objects.for_user(self.user)], ['Vegan']
+        )
+        res = client.post(TAGS_URL, {'name': 'Quick'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+
+@skipUnless(
+    'shard1' in settings.SHARD_DATABASES,
+    'run with DB_SHARDS=shard1 to test deletes across shards'
+)
+class DeleteUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = sample_user()
+        UserShard.objects.create(user=self.user, alias='shard1')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=3
+        )
+        recipe.tags.add(tag)
+
+    def test_delete_user(self):
+        """Test deleting a user deletes their rows on their shard"""
+        self.user.delete()
+
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        self.assertFalse(Tag.objects.using('shard1').exists())
+        self.assertFalse(
+            Recipe.tags.through.objects.using('shard1').exists()
+        )
+        self.assertFalse(UserShard.objects.exists())
+
+    def test_delete_users_queryset(self):
+        """Test that deleting users in bulk (e.g. the admin) does it too"""
+        get_user_model().objects.filter(pk=self.user.pk).delete()
+
+        self.assertFalse(Recipe.objects.using('shard1').exists())
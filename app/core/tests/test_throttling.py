@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+
+from core.tests.utils import TestCase
+from core.throttling import TokenBucketThrottle, LoginRateThrottle
+
+
+TOKEN_URL = reverse('user:token')
+
+
+class FixedThrottle(TokenBucketThrottle):
+    """Throttle everyone together, on a clock set by the test"""
+    rate = '3/min'
+    now = 1000.0
+
+    def timer(self):
+        return self.now
+
+    def get_cache_key(self, request, view):
+        return 'throttle_test'
+
+
+class TokenBucketThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def take(self, now):
+        FixedThrottle.now = now
+        throttle = FixedThrottle()
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_burst_then_refill(self):
+        """Test a full bucket allows a burst, then refills one per interval"""
+        for _ in range(3):
+            self.assertTrue(self.take(1000)[0])
+
+        allowed, throttle = self.take(1000)
+        self.assertFalse(allowed)
+        self.assertEqual(throttle.wait(), 20)
+
+        # one token back every 20 seconds
+        self.assertFalse(self.take(1019)[0])
+        self.assertTrue(self.take(1020)[0])
+        self.assertFalse(self.take(1020)[0])
+
+    def test_idle_bucket_refills_fully(self):
+        """Test the bucket doesn't grow past its size while idle"""
+        self.assertTrue(self.take(1000)[0])
+        for _ in range(3):
+            self.assertTrue(self.take(5000)[0])
+        self.assertFalse(self.take(5000)[0])
+
+    def test_denied_requests_take_no_tokens(self):
+        """Test that hammering while throttled doesn't delay the refill"""
+        for _ in range(3):
+            self.take(1000)
+        for _ in range(10):
+            self.take(1005)
+        self.assertTrue(self.take(1020)[0])
+
+
+class LoginThrottleApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    @patch.object(LoginRateThrottle, 'THROTTLE_RATES', {'login': '2/min'})
+    def test_login_throttled(self):
+        """Test that login attempts are limited, with a Retry-After"""
+        payload = {'email': 'nobody@test.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
@@ -0,0 +1,37 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from core.tests.utils import TransactionTestCase
+from core.versions import (
+    VERSION_KEY, bump_user_data_version, user_data_version
+)
+
+
+class UserDataVersionTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bumped_on_commit(self):
+        """Test the version moves only once the change commits"""
+        version = user_data_version(1)
+        with transaction.atomic():
+            bump_user_data_version(1, 'default')
+            self.assertEqual(user_data_version(1), version)
+        self.assertEqual(user_data_version(1), version + 1)
+
+        with transaction.atomic():
+            bump_user_data_version(1, 'default')
+            transaction.set_rollback(True)
+        self.assertEqual(user_data_version(1), version + 1)
+
+    def test_evicted_version_starts_over_higher(self):
+        """Test a version lost from the cache restarts above the old ones"""
+        version = user_data_version(1)
+        bump_user_data_version(1, 'default')
+        cache.delete(VERSION_KEY.format(1))
+        self.assertGreater(user_data_version(1), version + 1)
+
+        cache.delete(VERSION_KEY.format(1))
+        bump_user_data_version(1, 'default')
+        self.assertGreater(user_data_version(1), version + 1)
@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+
+from django import test
+from django.test import override_settings
+
+
+class TempMediaMixin:
+    """Keep the files the tests store in a MEDIA_ROOT of their own
+
+    The image GC and purge delete what the test database doesn't
+    reference, the real MEDIA_ROOT must be out of their reach.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        # the storages drop their cached location on setting_changed
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.remove_media_root()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls.remove_media_root()
+
+    @classmethod
+    def remove_media_root(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class TestCase(test.TestCase):
+    """TestCase rolling back every shard, not just 'default'"""
+    multi_db = True
+
+
+class TransactionTestCase(test.TransactionTestCase):
+    """TransactionTestCase flushing every shard, not just 'default'"""
+    multi_db = True
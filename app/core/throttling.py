@@ -0,0 +1,102 @@
+"""Token bucket request throttling
+
+The buckets are kept in the default cache, which must be shared by all the
+workers (memcached, see CACHE_BACKEND in settings) to limit clients across
+the fleet. Each bucket is a single integer, the time (in ms) at which the
+bucket will be full again, so an allowed request costs one atomic incr().
+"""
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Allow bursts of up to the rate's number of requests, refilled evenly
+
+    With a '60/min' rate a client can make 60 requests at once, then one
+    more each second.
+    """
+    # buckets outlive their refill time, so clients at the limit don't get
+    # a fresh bucket when the key expires (at most once per 10 periods)
+    KEY_TIMEOUT_PERIODS = 10
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = int(self.timer() * 1000)
+        # time to get back one token, and to refill the whole bucket
+        interval = self.duration * 1000 // self.num_requests
+        capacity = interval * self.num_requests
+        timeout = self.duration * self.KEY_TIMEOUT_PERIODS
+
+        try:
+            full_at = self.cache.incr(self.key, interval)
+        except ValueError:
+            if self.cache.add(self.key, now + interval, timeout):
+                return True
+            # someone else created the bucket in the meantime
+            full_at = self.cache.incr(self.key, interval)
+
+        if full_at - interval < now:
+            # the bucket was full already, start counting from now
+            self.cache.set(self.key, now + interval, timeout)
+            return True
+        if full_at - now <= capacity:
+            return True
+
+        # give back the token we couldn't take
+        self.cache.decr(self.key, interval)
+        self.wait_ms = full_at - now - capacity
+        return False
+
+    def wait(self):
+        """Return the seconds until the next token (the Retry-After)"""
+        return self.wait_ms / 1000
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """Throttle the login (token) endpoint by client address"""
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class UserEndpointThrottle(TokenBucketThrottle):
+    """Throttle each user (or anonymous address) per endpoint
+
+    Safe methods use the 'read' rate, others 'write'. Views (or actions)
+    can pick another rate with a throttle_scope attribute.
+    """
+
+    def __init__(self):
+        # the scope, and so the rate, depends on the request
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            self.scope = 'read' if request.method in (
+                'GET', 'HEAD', 'OPTIONS'
+            ) else 'write'
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        endpoint = getattr(view, 'basename', None) or type(view).__name__
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': f'{ident}_{endpoint}'
+        }
@@ -0,0 +1,55 @@
+"""Upload handlers hashing files while they stream in
+
+They replace Django's default handlers (settings.FILE_UPLOAD_HANDLERS)
+and leave the SHA-256 of each uploaded file in its content_hash, so
+content addressed names (core.models.recipe_image_file_path) don't need
+to read the file again.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, TemporaryFileUploadHandler
+)
+
+
+def content_digest(file):
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = getattr(file, 'content_hash', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+class HashingMixin:
+
+    def new_file(self, *args, **kwargs):
+        # before super(), which stops the handlers after the one in charge
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            # only the handler keeping the data hashes it, e.g. not the
+            # memory one for uploads too large for it
+            self.hasher.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    """Keep small uploads in memory, hashing them"""
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin,
+                                        TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file, hashing them"""
@@ -0,0 +1,45 @@
+"""Version numbers of each user's recipe data
+
+Bumped whenever one of the user's recipes, tags or ingredients changes
+(see recipe.signals), so anything derived from the data can be cached
+under the current version and never needs explicit invalidation.
+
+Versions move when the change commits: moved earlier, data computed from
+the state before the commit could be cached under the new version. They
+start from the clock, so a version evicted from the cache starts over
+above every number handed out before, and above the data cached for them.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = 'user-data-version:{}'
+
+
+def user_data_version(user_id):
+    """Return the current version of the data of user_id"""
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_data_version(user_id, using):
+    """Make data cached for earlier versions of user_id's data stale
+
+    Done when the transaction on database using commits.
+    """
+    transaction.on_commit(lambda: bump_now(user_id), using=using)
+
+
+def bump_now(user_id):
+    key = VERSION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # unknown (or evicted): no version was handed out from this value
+        cache.add(key, time.time_ns(), None)
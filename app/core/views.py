@@ -0,0 +1,145 @@
+"""Serving the uploaded media files
+
+Behind nginx (MEDIA_ACCEL = 'nginx') or Apache/lighttpd ('sendfile') the
+view only checks the file and hands the transfer to the proxy with an
+X-Accel-Redirect / X-Sendfile header. Otherwise it sends the file
+itself, with byte ranges and conditional requests. Media files are never
+rewritten (their names are unique or content addressed), so they are
+cached as immutable.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.encoding import iri_to_uri
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(path, st):
+    """Strong ETag: the digest of content addressed files, else stat based"""
+    digest = os.path.splitext(os.path.basename(path))[0]
+    if DIGEST_RE.match(digest):
+        return f'"{digest}"'
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Return the (start, end) byte range asked for, both inclusive
+
+    None means the whole file (no range, or several), and ValueError a
+    range out of the file.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def cache_headers(response, etag, st):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    response['Cache-Control'] = \
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Send the media file path, or have the front proxy send it"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('No such file')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('No such file')
+
+    etag = file_etag(full_path, st)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if etag in parse_etags(if_none_match) or if_none_match == '*':
+            return cache_headers(HttpResponseNotModified(), etag, st)
+    elif not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'), st.st_mtime, st.st_size
+    ):
+        return cache_headers(HttpResponseNotModified(), etag, st)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL:
+        # the proxy sends the file, with ranges
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_ACCEL == 'nginx':
+            response['X-Accel-Redirect'] = iri_to_uri(
+                settings.MEDIA_ACCEL_PREFIX + path
+            )
+        else:
+            response['X-Sendfile'] = full_path
+        return cache_headers(response, etag, st)
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+
+    if byte_range is None:
+        # FileResponse uses the server's wsgi.file_wrapper (sendfile)
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type
+        )
+        response['Content-Length'] = st.st_size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1),
+            status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        response['Content-Length'] = end - start + 1
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return cache_headers(response, etag, st)
@@ -0,0 +1,105 @@
+"""Type-ahead over the names of a user's tags and ingredients
+
+Matches starting with the text come first, then the ones containing it,
+both case-insensitive and ordered by UPPER(name) in code point order (not
+the database collation), then id: the same order from both lookups. By
+default they're looked up in
+the database, where (user_id, UPPER(name)) and trigram indexes back the
+LIKE queries (core migration 0012). With AUTOCOMPLETE_MEMORY_INDEX on,
+each worker keeps a sorted name index per recently active user instead,
+rebuilt when the user's data version changes (core.versions).
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Func
+
+from core.versions import user_data_version
+
+
+class SortKey(Func):
+    """UPPER() of a name, compared by code point on every database"""
+    function = 'UPPER'
+
+    def as_postgresql(self, compiler, connection):
+        sql, params = self.as_sql(compiler, connection)
+        return f'{sql} COLLATE "C"', params
+
+
+class NameIndex:
+    """Names of one user's objects, sorted case-insensitively"""
+
+    def __init__(self, rows):
+        entries = sorted((name.upper(), pk, name) for pk, name in rows)
+        self.keys = [key for key, _, _ in entries]
+        self.entries = entries
+
+    def search(self, text, limit):
+        text = text.upper()
+        start = bisect.bisect_left(self.keys, text)
+        found = []
+        for key, pk, name in self.entries[start:start + limit]:
+            if not key.startswith(text):
+                break
+            found.append((pk, name))
+        if len(found) < limit:
+            for key, pk, name in self.entries:
+                if text in key and not key.startswith(text):
+                    found.append((pk, name))
+                    if len(found) == limit:
+                        break
+        return found
+
+
+class IndexCache:
+    """Per worker LRU of NameIndex by (model, user), tagged with versions"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+    def get(self, queryset, user):
+        key = (queryset.model._meta.label, user.pk)
+        version = user_data_version(user.pk)
+        with self.lock:
+            cached = self.indexes.get(key)
+            if cached is not None and cached[0] == version:
+                self.indexes.move_to_end(key)
+                return cached[1]
+        index = NameIndex(
+            queryset.for_user(user).values_list('pk', 'name').iterator()
+        )
+        with self.lock:
+            self.indexes[key] = (version, index)
+            self.indexes.move_to_end(key)
+            while len(self.indexes) > settings.AUTOCOMPLETE_INDEX_USERS:
+                self.indexes.popitem(last=False)
+        return index
+
+
+index_cache = IndexCache()
+
+
+def search_database(queryset, user, text, limit):
+    names = queryset.for_user(user).order_by(
+        SortKey('name'), 'pk'
+    ).values_list('pk', 'name')
+    found = list(names.filter(name__istartswith=text)[:limit])
+    if len(found) < limit:
+        found += names.filter(name__icontains=text).exclude(
+            name__istartswith=text
+        )[:limit - len(found)]
+    return found
+
+
+def complete_names(queryset, user, text, limit):
+    """Return [(pk, name)] of user's objects matching text"""
+    if settings.AUTOCOMPLETE_MEMORY_INDEX:
+        return index_cache.get(queryset, user).search(text, limit)
+    return search_database(queryset, user, text, limit)
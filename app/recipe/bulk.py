@@ -0,0 +1,129 @@
+"""Changing many of a user's recipes at once
+
+bulk_update() and bulk_delete() work on the whole set with single UPDATE
+and DELETE statements and bulk M2M inserts, in one transaction. Being
+set-based, no signals fire: the work recipe.signals does per object
+(data version, tombstones, events, outbox, documents, similarity, image
+references) is done here once for the set.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Recipe, RecipeDocument, Tombstone
+from core.sharding import check_writable
+from core.versions import bump_user_data_version
+from recipe import documents, events, outbox
+from recipe.images import release_images
+from recipe.similarity import mark_dirty
+
+
+RELATIONS = (
+    ('tags', 'tag_id'),
+    ('ingredients', 'ingredient_id'),
+)
+
+
+def select_recipes(user, ids=None, tags=None, ingredients=None):
+    """Return the user's recipes among ids, with any of tags/ingredients"""
+    recipes = Recipe.objects.for_user(user)
+    if ids is not None:
+        recipes = recipes.filter(pk__in=ids)
+    if tags is not None:
+        recipes = recipes.filter(tags__in=tags)
+    if ingredients is not None:
+        recipes = recipes.filter(ingredients__in=ingredients)
+    return recipes.distinct()
+
+
+def add_relations(through, column, recipe_ids, related_ids, using):
+    """Link every recipe to every related object, skipping existing rows"""
+    existing = set(through.objects.using(using).filter(
+        recipe_id__in=recipe_ids, **{f'{column}__in': related_ids}
+    ).values_list('recipe_id', column))
+    through.objects.using(using).bulk_create([
+        through(recipe_id=recipe_id, **{column: related_id})
+        for recipe_id in recipe_ids for related_id in related_ids
+        if (recipe_id, related_id) not in existing
+    ])
+
+
+def lock_recipes(recipes):
+    """Return [(pk, user_id, image)] of recipes, locked until commit"""
+    # no FOR UPDATE with the DISTINCT of select_recipes()
+    ids = list(recipes.values_list('pk', flat=True))
+    return list(
+        Recipe.objects.using(recipes.db).filter(
+            pk__in=ids
+        ).select_for_update().values_list('pk', 'user_id', 'image')
+    )
+
+
+def bulk_update(recipes, fields=None, add=None, remove=None):
+    """Update the recipes of queryset recipes, returning their ids
+
+    fields are set on all of them; add and remove map 'tags' and
+    'ingredients' to the ids to link to or unlink from all of them.
+    """
+    fields, add, remove = fields or {}, add or {}, remove or {}
+    using = recipes.db
+    with transaction.atomic(using=using):
+        rows = lock_recipes(recipes)
+        if not rows:
+            return []
+        ids = [pk for pk, _, _ in rows]
+        user_id = rows[0][1]
+        check_writable(user_id)
+        # updated_at for the sync, relation changes don't save recipes
+        Recipe.objects.using(using).filter(pk__in=ids).update(
+            updated_at=timezone.now(), **fields
+        )
+        for relation, column in RELATIONS:
+            through = getattr(Recipe, relation).through
+            if remove.get(relation):
+                through.objects.using(using).filter(
+                    recipe_id__in=ids,
+                    **{f'{column}__in': remove[relation]}
+                )._raw_delete(using)
+            if add.get(relation):
+                add_relations(through, column, ids, add[relation], using)
+
+        bump_user_data_version(user_id, using)
+        if any(add.values()) or any(remove.values()):
+            mark_dirty(user_id, ids, using)
+        events.publish(user_id, 'recipe', 'updated', ids, using)
+        outbox.record(user_id, 'recipe', 'updated', ids, using)
+        if documents.enabled():
+            documents.rebuild_on_commit(ids, using)
+    return ids
+
+
+def bulk_delete(recipes):
+    """Delete the recipes of queryset recipes, returning their ids"""
+    using = recipes.db
+    with transaction.atomic(using=using):
+        rows = lock_recipes(recipes)
+        if not rows:
+            return []
+        ids = [pk for pk, _, _ in rows]
+        user_id = rows[0][1]
+        check_writable(user_id)
+        # what the regular cascade would delete first
+        for relation, _ in RELATIONS:
+            getattr(Recipe, relation).through.objects.using(using).filter(
+                recipe_id__in=ids
+            )._raw_delete(using)
+        RecipeDocument.objects.using(using).filter(
+            recipe_id__in=ids
+        )._raw_delete(using)
+        Recipe.objects.using(using).filter(pk__in=ids)._raw_delete(using)
+
+        Tombstone.objects.using(using).bulk_create([
+            Tombstone(user_id=user_id, model='recipe', object_id=pk)
+            for pk in ids
+        ])
+        bump_user_data_version(user_id, using)
+        mark_dirty(user_id, ids, using)
+        events.publish(user_id, 'recipe', 'deleted', ids, using)
+        outbox.record(user_id, 'recipe', 'deleted', ids, using)
+        release_images([image for _, _, image in rows if image], using)
+    return ids
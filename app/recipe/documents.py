@@ -0,0 +1,110 @@
+"""Recipe details rendered ahead of time
+
+With settings.RECIPE_DOCUMENTS on, every change to a recipe, its tags or
+its ingredients re-renders the recipe's RecipeDetailSerializer output
+into core.models.RecipeDocument (see recipe.signals), and the detail
+view returns the stored JSON after a single primary key lookup. The
+recipes changed by a transaction are re-rendered together once it
+commits.
+
+Image URLs are made absolute against RECIPE_DOCUMENTS_BASE_URL, so the
+documents are only served to requests to that scheme and host; others
+get the serializer output.
+"""
+import threading
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Recipe, RecipeDocument
+from recipe.serializers import RecipeDetailSerializer
+from recipe.sync import encode_cursor
+
+
+# recipe ids to rebuild on commit, per database alias
+pending = threading.local()
+
+
+def enabled():
+    return settings.RECIPE_DOCUMENTS
+
+
+def base_url():
+    return urljoin(settings.RECIPE_DOCUMENTS_BASE_URL, '/')
+
+
+def serves(request):
+    """Return whether the documents have the URLs request would get"""
+    return request.build_absolute_uri('/') == base_url()
+
+
+class DocumentRequest:
+    """Stands for the request in the serializer context of documents"""
+    user = AnonymousUser()
+
+    def build_absolute_uri(self, location):
+        return urljoin(base_url(), location)
+
+
+def render_document(recipe):
+    """Return the JSON bytes of the recipe detail"""
+    serializer = RecipeDetailSerializer(
+        recipe, context={'request': DocumentRequest()}
+    )
+    return JSONRenderer().render(serializer.data)
+
+
+def rebuild_documents(recipe_ids, using):
+    """Render the documents of the recipes recipe_ids of shard using"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return 0
+    with transaction.atomic(using=using):
+        # one rebuild of a recipe at a time, each from the latest commit:
+        # no colliding inserts, and no older render landing last
+        recipes = Recipe.objects.using(using).filter(
+            pk__in=recipe_ids
+        ).order_by('pk').select_for_update().prefetch_related(
+            'tags', 'ingredients'
+        )
+        documents = [
+            RecipeDocument(
+                recipe_id=recipe.pk, user_id=recipe.user_id,
+                body=render_document(recipe)
+            ) for recipe in recipes
+        ]
+        RecipeDocument.objects.using(using).filter(
+            recipe_id__in=recipe_ids
+        ).delete()
+        RecipeDocument.objects.using(using).bulk_create(documents)
+    return len(documents)
+
+
+def rebuild_on_commit(recipe_ids, using):
+    """Rebuild the documents of recipe_ids once the transaction commits"""
+    pending.__dict__.setdefault(using, set()).update(recipe_ids)
+    # the first callback to run rebuilds all the transaction's recipes
+    transaction.on_commit(lambda: rebuild_pending(using), using=using)
+
+
+def rebuild_pending(using):
+    recipe_ids = pending.__dict__.pop(using, None)
+    if recipe_ids:
+        rebuild_documents(recipe_ids, using)
+
+
+def get_document(user, recipe_id):
+    """Return the stored document of a recipe of user and its ETag
+
+    None if there's no document.
+    """
+    document = RecipeDocument.objects.for_user(user).filter(
+        recipe_id=recipe_id
+    ).values_list('body', 'updated').first()
+    if document is None:
+        return None
+    body, updated = document
+    return bytes(body), f'"{recipe_id}-{encode_cursor(updated)}"'
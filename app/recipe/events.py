@@ -0,0 +1,211 @@
+"""Push notifications of changes to a user's recipes, tags and ingredients
+
+Changes are published to a per worker EventBus, which hands each event
+to the open streams (recipe.views.EventStreamView) of its user. On
+Postgres, events are sent with NOTIFY in the writing transaction, so
+they go out on commit and reach every worker: each worker runs one
+LISTEN thread per shard, started with its first stream. Elsewhere they
+are published to the local bus on commit.
+
+Each open stream holds its worker (thread) for up to
+EVENT_STREAM_MAX_SECONDS. Streams mostly wait, so they are meant for
+workers holding many cheaply, e.g. gunicorn --worker-class gevent: with
+sync workers, a handful of clients would take every worker. A worker
+keeps at most EVENT_STREAM_MAX_OPEN streams open, further ones get a 503
+(clients retry later).
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from django.db import connections, transaction
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from recipe.sync import sync_cursor
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'recipe_events'
+QUEUE_SIZE = 100
+# the event sent in place of the ones a slow stream missed
+OVERFLOW = {'type': 'overflow'}
+
+
+class Subscription:
+    """Queue of the events of one user for one stream"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # the client resyncs with the changes endpoint
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Return the next event, or None after timeout seconds"""
+        if self.overflowed:
+            self.overflowed = False
+            with self.events.mutex:
+                self.events.queue.clear()
+            return OVERFLOW
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Fan-out of events to the subscriptions of this worker"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, user_id, limit=None):
+        """Return a subscription of user_id, None if limit ones are open"""
+        subscription = Subscription(user_id)
+        with self.lock:
+            if limit is not None and sum(
+                map(len, self.subscriptions.values())
+            ) >= limit:
+                return None
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, ())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+bus = EventBus()
+
+
+class Listener(threading.Thread):
+    """Thread forwarding the NOTIFY events of a Postgres shard to the bus"""
+    daemon = True
+
+    def __init__(self, alias):
+        super().__init__(name=f'recipe-events-{alias}')
+        self.alias = alias
+
+    def run(self):
+        wrapper = connections[self.alias]
+        connection = wrapper.get_new_connection(
+            wrapper.get_connection_params()
+        )
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        while True:
+            select.select([connection], [], [], 60)
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                try:
+                    user_id, event = json.loads(notify.payload)
+                except ValueError:
+                    logger.warning('Bad recipe event: %s', notify.payload)
+                    continue
+                bus.publish(user_id, event)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF accept text/event-stream, errors are sent as JSON"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+class EventStream:
+    """The events of subscription as server-sent events
+
+    Comments are sent every heartbeat seconds of silence, keeping proxies
+    from closing the connection, and the stream ends after duration
+    seconds (the client reconnects). Closing it unsubscribes, even if it
+    was never iterated (e.g. a response that is never sent).
+    """
+
+    def __init__(self, subscription, heartbeat, duration):
+        self.subscription = subscription
+        self.heartbeat = heartbeat
+        self.duration = duration
+
+    def __iter__(self):
+        deadline = time.monotonic() + self.duration
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                event = self.subscription.get(self.heartbeat)
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield (
+                        f'event: {event["type"]}\n'
+                        f'data: {json.dumps(event)}\n\n'
+                    )
+        finally:
+            self.close()
+
+    def close(self):
+        bus.unsubscribe(self.subscription)
+
+
+listeners = {}
+listeners_lock = threading.Lock()
+
+
+def ensure_listener(alias):
+    """Start the LISTEN thread of shard alias, on Postgres"""
+    if connections[alias].vendor != 'postgresql':
+        return
+    with listeners_lock:
+        listener = listeners.get(alias)
+        if listener is None or not listener.is_alive():
+            listener = listeners[alias] = Listener(alias)
+            listener.start()
+
+
+def publish(user_id, model_name, action, ids, using):
+    """Publish that objects of user_id were created/updated/deleted
+
+    Sent when the transaction on database using commits.
+    """
+    event = {
+        'type': model_name,
+        'action': action,
+        'ids': list(ids),
+        # for catching up through the changes endpoint, lagging like its
+        # own cursors: other transactions may commit older changes later
+        'cursor': sync_cursor(timezone.now()),
+    }
+    if connections[using].vendor == 'postgresql':
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [CHANNEL, json.dumps([user_id, event])]
+            )
+    else:
+        transaction.on_commit(
+            lambda: bus.publish(user_id, event), using=using
+        )
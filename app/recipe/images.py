@@ -0,0 +1,113 @@
+"""Recipe image references
+
+Images are shared by the recipes holding the same content (see
+core.storage), so recipes drop their reference to an image instead of
+deleting the file, once the change is committed. Files no recipe points
+at (older uploads, failed requests) are found by orphaned_images().
+"""
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import ImageBlob, Recipe
+from core.sharding import shard_aliases
+
+
+IMAGE_DIR = 'upload/recipe'
+
+
+def release_image(recipe, name):
+    """Drop the reference of recipe to the stored image name"""
+    release_images([name], recipe._state.db)
+
+
+def release_images(names, using):
+    """Drop a reference to each stored image of names (of shard using)"""
+    storage = Recipe._meta.get_field('image').storage
+
+    def release():
+        for name in names:
+            storage.delete(name)
+    transaction.on_commit(release, using=using)
+
+
+def walk_files(path):
+    """Yield the DirEntry of every file under path, one at a time"""
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def referenced_images(names):
+    """Return the names among names used by a recipe, on any shard"""
+    referenced = set()
+    for alias in shard_aliases():
+        referenced.update(
+            Recipe.objects.using(alias).filter(
+                image__in=names
+            ).values_list('image', flat=True)
+        )
+    return referenced
+
+
+def orphaned_images(grace, batch_size=1000):
+    """Yield (name, DirEntry) of the image files no recipe uses
+
+    Files younger than grace (seconds) are left alone: their recipe may
+    not be committed yet.
+    """
+    root = settings.MEDIA_ROOT
+    cutoff = time.time() - grace
+    batch = []
+
+    def flush():
+        referenced = referenced_images([name for name, _ in batch])
+        for name, entry in batch:
+            if name not in referenced:
+                yield name, entry
+        batch.clear()
+
+    for entry in walk_files(os.path.join(root, IMAGE_DIR)):
+        if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+            continue
+        name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+        batch.append((name, entry))
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def remove_orphan(name, path, grace, quarantine=None):
+    """Delete (or move to quarantine) an orphaned image file
+
+    Returns its size, or None when it was used again in the meantime.
+    """
+    with transaction.atomic():
+        # storage saves deduplicating into this file hold the same lock
+        # and refresh its mtime
+        ImageBlob.objects.select_for_update().filter(name=name).first()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if st.st_mtime > time.time() - grace:
+            return None
+        if quarantine:
+            target = os.path.join(quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        else:
+            os.remove(path)
+        ImageBlob.objects.filter(name=name).delete()
+    return st.st_size
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.outbox import dispatch_all
+
+
+class Command(BaseCommand):
+    """Django command to deliver the outbox events to the webhook"""
+    help = 'Deliver pending outbox events to OUTBOX_WEBHOOK_URL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Deliver what is due, then exit'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Events taken per shard and round'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Concurrent deliveries'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Seconds to wait when nothing was due'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            delivered, failed = dispatch_all(
+                options['batch_size'], options['workers']
+            )
+            if delivered or failed:
+                self.stdout.write(f'Delivered {delivered}, failed {failed}')
+                # failed events wait for their retry, so this ends
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
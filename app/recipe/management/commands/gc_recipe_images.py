@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from recipe.images import orphaned_images, remove_orphan
+
+
+class Command(BaseCommand):
+    """Django command to remove recipe image files no recipe uses"""
+    help = 'Delete (or quarantine) orphaned files under the recipe ' \
+           'image upload directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Leave files modified more recently alone'
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Move orphans under this directory instead of deleting'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        grace = options['grace_hours'] * 60 * 60
+        orphans, reclaimed = 0, 0
+        for name, entry in orphaned_images(grace, options['batch_size']):
+            if options['dry_run']:
+                size = entry.stat().st_size
+            else:
+                size = remove_orphan(
+                    name, entry.path, grace, options['quarantine']
+                )
+                if size is None:
+                    continue
+            orphans += 1
+            reclaimed += size
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {name} ({size} bytes)')
+
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {reclaimed} bytes from {orphans} orphaned images'
+        ))
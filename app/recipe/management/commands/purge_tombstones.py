@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipe.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    """Django command to delete the tombstones no sync needs anymore"""
+    help = 'Delete deletion records older than SYNC_TOMBSTONE_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones'))
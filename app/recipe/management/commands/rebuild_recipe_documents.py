@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from core.sharding import shard_aliases
+from recipe.documents import rebuild_documents
+
+
+class Command(BaseCommand):
+    """Django command to render the documents of all recipes"""
+    help = 'Rebuild the precomputed recipe documents, shard by shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for alias in shard_aliases():
+            recipes = Recipe.objects.using(alias).order_by('pk')
+            last_pk, rebuilt = 0, 0
+            while True:
+                ids = list(recipes.filter(pk__gt=last_pk).values_list(
+                    'pk', flat=True
+                )[:options['batch_size']])
+                if not ids:
+                    break
+                rebuilt += rebuild_documents(ids, alias)
+                last_pk = ids[-1]
+            self.stdout.write(f'{alias}: {rebuilt} documents rebuilt')
+        self.stdout.write(self.style.SUCCESS('Done'))
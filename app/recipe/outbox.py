@@ -0,0 +1,218 @@
+"""Transactional outbox of recipe, tag and ingredient changes
+
+record() writes an OutboxEvent in the transaction making the change, so
+events exist exactly for the committed changes, and writes never wait
+on integrations. The dispatch_outbox command then delivers them to
+OUTBOX_WEBHOOK_URL: pending events are leased in batches, the events of
+the same object are coalesced into one delivery carrying its current
+state, deliveries run concurrently, and failures are retried with
+exponential backoff until OUTBOX_MAX_ATTEMPTS.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import Ingredient, OutboxEvent, Recipe, Tag
+from core.sharding import shard_aliases
+from recipe.serializers import (
+    IngredientSerializer, RecipeSerializer, TagSerializer
+)
+
+
+logger = logging.getLogger(__name__)
+
+SERIALIZERS = {
+    'recipe': (Recipe, RecipeSerializer),
+    'tag': (Tag, TagSerializer),
+    'ingredient': (Ingredient, IngredientSerializer),
+}
+# a dispatcher that died leaves its events to others after this
+LEASE = timedelta(minutes=5)
+
+
+def enabled():
+    return bool(settings.OUTBOX_WEBHOOK_URL)
+
+
+def record(user_id, model_name, action, ids, using):
+    """Add events for a change, in the current transaction of using
+
+    post_save comes after Model.save()'s own transaction, so writers must
+    wrap their saves in transaction.atomic(using=shard).
+    """
+    if not enabled():
+        return
+    if not connections[using].in_atomic_block:
+        logger.warning(
+            'Outbox event for %s %s recorded outside of a transaction, '
+            'it commits apart from the change', model_name, list(ids)
+        )
+    OutboxEvent.objects.using(using).bulk_create([
+        OutboxEvent(
+            user_id=user_id, model=model_name, object_id=object_id,
+            action=action
+        ) for object_id in ids
+    ])
+
+
+def lease(using, batch_size):
+    """Take up to batch_size due events of shard using, for LEASE"""
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        events = list(
+            OutboxEvent.objects.using(using).select_for_update(
+                skip_locked=True
+            ).filter(
+                dead=False, next_attempt_at__lte=now
+            ).order_by('pk')[:batch_size]
+        )
+        OutboxEvent.objects.using(using).filter(
+            pk__in=[event.pk for event in events]
+        ).update(next_attempt_at=now + LEASE)
+    return events
+
+
+def coalesce(events):
+    """Group events by object: [(last event, [event ids])], in order
+
+    A creation followed by updates stays a creation, a deletion wins.
+    """
+    groups = {}
+    for event in events:
+        key = (event.model, event.object_id)
+        _, ids, created = groups.get(key, (None, [], False))
+        created = created or event.action == 'created'
+        groups[key] = (event, ids + [event.pk], created)
+    deliveries = []
+    for last, ids, created in groups.values():
+        if created and last.action == 'updated':
+            last.action = 'created'
+        deliveries.append((last, ids))
+    return deliveries
+
+
+def current_state(deliveries, using):
+    """Return {(model, id): serialized object} of the objects still there"""
+    state = {}
+    for model_name, (model, serializer_class) in SERIALIZERS.items():
+        ids = [
+            event.object_id for event, _ in deliveries
+            if event.model == model_name and event.action != 'deleted'
+        ]
+        if not ids:
+            continue
+        objects = model.objects.using(using).filter(pk__in=ids)
+        if model is Recipe:
+            objects = objects.prefetch_related('tags', 'ingredients')
+        for obj in objects:
+            state[(model_name, obj.pk)] = serializer_class(obj).data
+    return state
+
+
+def payload(event, ids, data):
+    return {
+        # the same id again means the same delivery again
+        'id': max(ids),
+        'type': event.model,
+        'action': event.action,
+        'object_id': event.object_id,
+        'user': event.user_id,
+        'occurred_at': event.created.isoformat(),
+        'data': data,
+    }
+
+
+def deliver(body):
+    """POST one event to the webhook, raising on failure"""
+    data = json.dumps(body, cls=JSONEncoder).encode()
+    request = urllib.request.Request(
+        settings.OUTBOX_WEBHOOK_URL, data=data, method='POST',
+        headers={
+            'Content-Type': 'application/json',
+            'X-Event-Id': str(body['id']),
+        }
+    )
+    if settings.OUTBOX_WEBHOOK_SECRET:
+        request.add_header('X-Signature', hmac.new(
+            settings.OUTBOX_WEBHOOK_SECRET.encode(), data, hashlib.sha256
+        ).hexdigest())
+    with urllib.request.urlopen(
+        request, timeout=settings.OUTBOX_TIMEOUT_SECONDS
+    ) as response:
+        response.read()
+
+
+def backoff(attempts):
+    """Delay before retrying after attempts failures, with jitter"""
+    seconds = min(2 ** attempts, 3600)
+    return timedelta(seconds=seconds * random.uniform(0.5, 1))
+
+
+def dispatch(using, batch_size=100, workers=8):
+    """Deliver a batch of due events of shard using
+
+    Returns the number of (coalesced) deliveries made and failed.
+    """
+    deliveries = coalesce(lease(using, batch_size))
+    if not deliveries:
+        return 0, 0
+    state = current_state(deliveries, using)
+
+    def send(delivery):
+        event, ids = delivery
+        data = state.get((event.model, event.object_id))
+        if data is None and event.action != 'deleted':
+            # deleted since, its deletion event follows
+            return None
+        try:
+            deliver(payload(event, ids, data))
+        except Exception as error:
+            return f'{type(error).__name__}: {error}'
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = list(executor.map(send, deliveries))
+
+    delivered, failed = [], []
+    for (event, ids), error in zip(deliveries, errors):
+        if error is None:
+            delivered += ids
+        else:
+            failed.append((ids, error))
+    OutboxEvent.objects.using(using).filter(pk__in=delivered).delete()
+    now = timezone.now()
+    for ids, error in failed:
+        events = OutboxEvent.objects.using(using).filter(pk__in=ids)
+        attempts = events.aggregate(attempts=Max('attempts'))['attempts']
+        if attempts is None:
+            # deleted in the meantime, e.g. by purge_user
+            continue
+        attempts += 1
+        events.update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + backoff(attempts),
+            last_error=error,
+            dead=attempts >= settings.OUTBOX_MAX_ATTEMPTS
+        )
+    return len(deliveries) - len(failed), len(failed)
+
+
+def dispatch_all(batch_size=100, workers=8):
+    """Deliver a batch of due events of every shard"""
+    delivered, failed = 0, 0
+    for alias in shard_aliases():
+        counts = dispatch(alias, batch_size, workers)
+        delivered += counts[0]
+        failed += counts[1]
+    return delivered, failed
@@ -0,0 +1,181 @@
+"""Resized renditions of recipe images
+
+Renditions are made by Pillow on first request and kept in
+RENDITION_CACHE_DIR, which is trimmed back under RENDITION_CACHE_MAX_BYTES
+by evicting the least recently used files (reads touch the mtime).
+Requested widths are rounded up to one of RENDITION_WIDTHS, so the cache
+holds a bounded number of variants per image.
+
+Making a rendition holds an flock on a lock file picked by the rendition
+key, so when several workers or threads want the same missing rendition
+only one encodes it and the others wait and read the result. The bytes
+stored are counted in a file next to the locks, under an flock too, so
+the workers sharing the directory count against the same cap.
+"""
+import fcntl
+import hashlib
+import io
+import os
+import uuid
+
+from PIL import Image, features
+from django.conf import settings
+
+
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+if features.check('webp'):
+    FORMATS['webp'] = ('WEBP', 'image/webp')
+
+LOCK_BUCKETS = 256
+
+
+def rendition_width(width):
+    """Round width up to one of RENDITION_WIDTHS"""
+    for allowed in sorted(settings.RENDITION_WIDTHS):
+        if allowed >= width:
+            return allowed
+    return max(settings.RENDITION_WIDTHS)
+
+
+def rendition_key(name, width, fmt):
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return f'{digest}-{width}.{fmt}'
+
+
+def render(path, width, fmt):
+    """Return the bytes of the image at path resized to width
+
+    Images narrower than width keep their size.
+    """
+    image = Image.open(path)
+    width = min(width, image.width)
+    height = max(1, round(image.height * width / image.width))
+    # lets JPEG decoding scale down on the way
+    image.draft('RGB', (width, height))
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image = image.resize((width, height), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, format=FORMATS[fmt][0])
+    return out.getvalue()
+
+
+class RenditionCache:
+    """Disk cache of renditions, evicting the least recently used"""
+
+    @property
+    def directory(self):
+        return settings.RENDITION_CACHE_DIR
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def lock_path(self, key):
+        bucket = int(key[:8], 16) % LOCK_BUCKETS
+        return os.path.join(self.directory, 'locks', f'{bucket}.lock')
+
+    @property
+    def size_path(self):
+        return os.path.join(self.directory, 'locks', 'size')
+
+    def open(self, key, make):
+        """Open rendition key for reading, calling make() if it's missing
+
+        The file is returned open, so evicting it doesn't break readers.
+        """
+        path = self.path(key)
+        file = self.open_existing(path)
+        if file is not None:
+            return file
+
+        os.makedirs(os.path.dirname(self.lock_path(key)), exist_ok=True)
+        with open(self.lock_path(key), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # made while waiting for the lock
+            file = self.open_existing(path)
+            if file is not None:
+                return file
+            data = make()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.{uuid.uuid4().hex}.part'
+            with open(partial, 'wb') as out:
+                out.write(data)
+            os.replace(partial, path)
+            file = open(path, 'rb')
+        self.added(len(data))
+        return file
+
+    def open_existing(self, path):
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        # recently used
+        os.utime(file.fileno())
+        return file
+
+    def entries(self):
+        for bucket in os.scandir(self.directory):
+            if bucket.is_dir() and bucket.name != 'locks':
+                for entry in os.scandir(bucket.path):
+                    if not entry.name.endswith('.part'):
+                        yield entry
+
+    def stored_size(self):
+        """Return the bytes stored as counted, None before the first count"""
+        try:
+            with open(self.size_path) as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def added(self, size):
+        """Count size bytes more stored, evicting when over the cap"""
+        os.makedirs(os.path.dirname(self.size_path), exist_ok=True)
+        fd = os.open(self.size_path, os.O_RDWR | os.O_CREAT)
+        with open(fd, 'r+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                total = int(file.read()) + size
+            except ValueError:
+                # first count, size included
+                total = sum(entry.stat().st_size for entry in self.entries())
+            if total > settings.RENDITION_CACHE_MAX_BYTES:
+                total = self.evict()
+            file.seek(0)
+            file.truncate()
+            file.write(str(total))
+
+    def evict(self):
+        """Remove the least recently used renditions, to 90% of the cap
+
+        Returns the bytes left, counted afresh.
+        """
+        files = sorted(
+            ((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+             for entry in self.entries())
+        )
+        total = sum(size for _, size, _ in files)
+        target = settings.RENDITION_CACHE_MAX_BYTES * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+rendition_cache = RenditionCache()
+
+
+def open_rendition(name, path, width, fmt):
+    """Return the rendition of image name (stored at path), opened"""
+    return rendition_cache.open(
+        rendition_key(name, width, fmt), lambda: render(path, width, fmt)
+    )
@@ -1,6 +1,9 @@
+from django.db import transaction
 from rest_framework import serializers
 
 from core.models import Tag, Ingredient, Recipe
+from core.sharding import shard_for_user
+from recipe.images import release_image
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -27,21 +30,79 @@ class RecipeSerializer(serializers.ModelSerializer):
     # be returned
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
-        queryset=Ingredient.objects.all()
+        queryset=Ingredient.objects.all(),
+        required=False
     )
 
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        required=False
+    )
+
+    # tags and ingredients can also be given by name, the missing ones
+    # are created along with the recipe
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
+    )
+
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
     )
 
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'time_minutes',
                   'ingredients', 'price', 'link',
-                  'tags')
+                  'tags', 'ingredient_names', 'tag_names')
         read_only_fields = ('id',)
 
+    def get_fields(self):
+        """Limit related objects to the ones of the requesting user"""
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return fields
+        for name, model in (('ingredients', Ingredient), ('tags', Tag)):
+            field = fields[name]
+            # they live on the user's shard, Model.objects would miss them
+            if isinstance(field, serializers.ManyRelatedField):
+                field.child_relation.queryset = model.objects.for_user(
+                    request.user
+                )
+        return fields
+
+    def resolve_names(self, user, validated_data):
+        """Add the tags and ingredients given by name to the id lists"""
+        for field, names_field, model in (
+            ('ingredients', 'ingredient_names', Ingredient),
+            ('tags', 'tag_names', Tag),
+        ):
+            names = validated_data.pop(names_field, None)
+            if names is None:
+                continue
+            objects = model.objects.get_or_create_names(user, names)
+            validated_data[field] = list(dict.fromkeys(
+                list(validated_data.get(field, [])) + objects
+            ))
+
+    def create(self, validated_data):
+        """Create a recipe, with its named tags and ingredients"""
+        user = validated_data['user']
+        with transaction.atomic(using=shard_for_user(user)):
+            self.resolve_names(user, validated_data)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        """Update a recipe, with its named tags and ingredients"""
+        with transaction.atomic(using=instance._state.db):
+            self.resolve_names(instance.user_id, validated_data)
+            return super().update(instance, validated_data)
+
 
 # Detail serializers is based on RecipeSerializer
 class RecipeDetailSerializer(RecipeSerializer):
@@ -57,4 +118,79 @@ class RecipeImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'image')
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+    def update(self, instance, validated_data):
+        """Replace the image, dropping the reference to the old one"""
+        old = instance.image.name
+        with transaction.atomic(using=instance._state.db):
+            instance = super().update(instance, validated_data)
+            # a saved upload took a new reference, even to the old file
+            if old and 'image' in validated_data:
+                release_image(instance, old)
+        return instance
+
+
+def id_list(**kwargs):
+    return serializers.ListField(
+        child=serializers.IntegerField(), required=False, **kwargs
+    )
+
+
+class RecipeSelectionSerializer(serializers.Serializer):
+    """The user's recipes a bulk action applies to
+
+    Those among ids, having any of tags, and any of ingredients.
+    """
+    ids = id_list(min_length=1)
+    tags = id_list(min_length=1)
+    ingredients = id_list(min_length=1)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError(
+                'Give ids, tags or ingredients to select recipes.'
+            )
+        return attrs
+
+
+class RecipeFieldsSerializer(serializers.ModelSerializer):
+    """Recipe fields set by bulk updates"""
+
+    class Meta:
+        model = Recipe
+        fields = ('title', 'time_minutes', 'price', 'link')
+        extra_kwargs = {field: {'required': False} for field in fields}
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    """Serializer for deleting many recipes"""
+    filter = RecipeSelectionSerializer()
+
+
+class RecipeBulkUpdateSerializer(RecipeBulkDeleteSerializer):
+    """Serializer for changing many recipes the same way"""
+    set = RecipeFieldsSerializer(required=False)
+    add_tags = id_list()
+    remove_tags = id_list()
+    add_ingredients = id_list()
+    remove_ingredients = id_list()
+
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError('Nothing to change.')
+        user = self.context['request'].user
+        # linking other users' tags and ingredients isn't allowed
+        for field, model in (
+            ('add_tags', Tag), ('add_ingredients', Ingredient)
+        ):
+            ids = set(attrs.get(field, ()))
+            found = set(model.objects.for_user(user).filter(
+                pk__in=ids
+            ).values_list('pk', flat=True))
+            if ids - found:
+                raise serializers.ValidationError({
+                    field: f'Invalid pk {min(ids - found)} - object does '
+                           f'not exist.'
+                })
+        return attrs
@@ -0,0 +1,43 @@
+"""Ingredients needed for a set of recipes"""
+from itertools import groupby
+
+from django.db import connections
+
+from core.models import Recipe
+
+
+def shopping_list(user, recipe_ids):
+    """Return the ingredients of user's recipes recipe_ids, each once
+
+    With the recipes using each one; a single query over the M2M table,
+    whatever the number of recipes.
+    """
+    using = Recipe.objects.for_user(user).db
+    rows = Recipe.ingredients.through.objects.using(using).filter(
+        recipe__user=user, recipe_id__in=recipe_ids
+    ).order_by('ingredient__name', 'ingredient_id')
+
+    if connections[using].vendor == 'postgresql':
+        # needs psycopg2, not there for sqlite-only setups
+        from django.contrib.postgres.aggregates import ArrayAgg
+
+        rows = rows.values('ingredient_id', 'ingredient__name').annotate(
+            recipes=ArrayAgg('recipe_id')
+        )
+        return [{
+            'id': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'recipes': sorted(row['recipes']),
+        } for row in rows]
+
+    # no array aggregate elsewhere, the rows come grouped by ingredient
+    rows = rows.order_by(
+        'ingredient__name', 'ingredient_id', 'recipe_id'
+    ).values_list('ingredient_id', 'ingredient__name', 'recipe_id')
+    return [{
+        'id': ingredient_id,
+        'name': name,
+        'recipes': [recipe_id for _, _, recipe_id in group],
+    } for (ingredient_id, name), group in groupby(
+        rows, key=lambda row: row[:2]
+    )]
@@ -0,0 +1,121 @@
+"""Keeping data derived from recipes, tags and ingredients up to date
+
+On every change: the user's data version (cached data), the precomputed
+recipe documents, the similar recipes matrices, the sync timestamps and
+tombstones, the event streams and the outbox.
+"""
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+from core.storage import take_reference
+from core.versions import bump_user_data_version
+from recipe import documents, events, outbox, sync
+from recipe.images import release_image
+from recipe.similarity import mark_dirty
+
+
+def remember_recipes(instance):
+    """Keep the recipe ids of a tag or ingredient, before its M2M rows go"""
+    instance._recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+def recipes_changed(user_id, recipe_ids, using):
+    """Update what depends on the tags and ingredients of recipe_ids"""
+    if not recipe_ids:
+        return
+    sync.touch_recipes(recipe_ids, using)
+    mark_dirty(user_id, recipe_ids, using)
+    events.publish(user_id, 'recipe', 'updated', recipe_ids, using)
+    outbox.record(user_id, 'recipe', 'updated', recipe_ids, using)
+    if documents.enabled():
+        documents.rebuild_on_commit(recipe_ids, using)
+
+
+def publish(instance, action):
+    args = (
+        instance.user_id, instance._meta.model_name, action, [instance.pk],
+        instance._state.db
+    )
+    events.publish(*args)
+    outbox.record(*args)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    using = instance._state.db
+    bump_user_data_version(instance.user_id, instance._state.db)
+    # from __dict__, a deferred image isn't loaded (nor was it saved)
+    image = instance.__dict__.get('image')
+    if image:
+        take_reference(str(image), using)
+    mark_dirty(instance.user_id, [instance.pk], using)
+    publish(instance, 'created' if created else 'updated')
+    if documents.enabled():
+        documents.rebuild_on_commit([instance.pk], using)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_user_data_version(instance.user_id, instance._state.db)
+    mark_dirty(instance.user_id, [instance.pk], instance._state.db)
+    sync.record_deletion(instance)
+    publish(instance, 'deleted')
+    if instance.image:
+        release_image(instance, instance.image.name)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def attr_saved(sender, instance, created, **kwargs):
+    bump_user_data_version(instance.user_id, instance._state.db)
+    publish(instance, 'created' if created else 'updated')
+    # a rename shows in the documents of every recipe using it
+    if documents.enabled() and not created:
+        documents.rebuild_on_commit(
+            instance.recipe_set.values_list('pk', flat=True),
+            instance._state.db
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def attr_deleting(sender, instance, **kwargs):
+    # the M2M rows go without signals
+    remember_recipes(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def attr_deleted(sender, instance, **kwargs):
+    bump_user_data_version(instance.user_id, instance._state.db)
+    sync.record_deletion(instance)
+    publish(instance, 'deleted')
+    recipes_changed(
+        instance.user_id, instance.__dict__.pop('_recipe_ids', []),
+        instance._state.db
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    # instance is the recipe, or the tag/ingredient on reverse changes
+    if reverse and action == 'pre_clear':
+        remember_recipes(instance)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_recipe_ids', [])
+    else:
+        recipe_ids = list(pk_set)
+    bump_user_data_version(instance.user_id, instance._state.db)
+    recipes_changed(instance.user_id, recipe_ids, instance._state.db)
@@ -0,0 +1,219 @@
+"""Similar recipes, by the Jaccard index of their tags and ingredients
+
+Each worker keeps, for recently active users, a sparse recipe x feature
+(tag or ingredient) incidence matrix; scoring one recipe against all the
+others is one sparse matrix-vector product. Recipe changes are recorded
+in the cache as a numbered sequence of dirty recipe ids (mark_dirty(),
+called from recipe.signals), and matrices replace just those rows when
+they're next used, falling back to a full rebuild when the sequence has
+a gap or too many changes.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from scipy import sparse
+
+from core.models import Recipe
+
+
+SEQ_KEY = 'recipe-changes:{}'
+CHANGE_KEY = 'recipe-changes:{}:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+# more changes than this and a rebuild is cheaper
+MAX_CHANGES = 500
+
+
+def change_seq(user_id):
+    return cache.get(SEQ_KEY.format(user_id), 0)
+
+
+def record_change(user_id, recipe_ids):
+    key = SEQ_KEY.format(user_id)
+    try:
+        seq = cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        seq = cache.incr(key)
+    cache.set(CHANGE_KEY.format(user_id, seq), recipe_ids, CHANGE_TIMEOUT)
+
+
+def mark_dirty(user_id, recipe_ids, using=None):
+    """Record that recipes of user_id changed, once committed"""
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(
+        lambda: record_change(user_id, recipe_ids), using=using
+    )
+
+
+def recipe_features(user_id, using, recipe_ids=None):
+    """Return the recipe ids of user and their (kind, id) features"""
+    recipes = Recipe.objects.using(using).filter(user_id=user_id)
+    links = []
+    for kind, relation in (('tag', 'tags'), ('ingredient', 'ingredients')):
+        rows = getattr(Recipe, relation).through.objects.using(using).filter(
+            recipe__user_id=user_id
+        )
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        links.append((kind, rows.values_list('recipe_id', f'{kind}_id')))
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    ids = list(recipes.values_list('pk', flat=True))
+    features = {pk: [] for pk in ids}
+    for kind, rows in links:
+        for recipe_id, feature_id in rows:
+            if recipe_id in features:
+                features[recipe_id].append((kind, feature_id))
+    return features
+
+
+Snapshot = namedtuple('Snapshot', 'matrix ids sizes row_of')
+
+
+def snapshot(matrix, ids):
+    return Snapshot(
+        matrix, ids, np.diff(matrix.indptr).astype(np.float32),
+        {pk: row for row, pk in enumerate(ids.tolist())}
+    )
+
+
+class SimilarityIndex:
+    """Incidence matrix of the recipes of one user
+
+    Updates build a new Snapshot of the matrix and swap it in with one
+    assignment, so similar() can run unlocked while an update goes on.
+    """
+
+    def __init__(self, user_id, using):
+        self.user_id = user_id
+        self.using = using
+        self.columns = {}
+        self.snapshot = snapshot(
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            np.zeros(0, dtype=np.int64)
+        )
+        self.seq = change_seq(user_id)
+        self.append(recipe_features(user_id, using))
+
+    def append(self, features, matrix=None, ids=None):
+        """Add rows for the recipes of features ({id: [feature]})
+
+        To matrix and ids if given, else to the current snapshot's.
+        """
+        if matrix is None:
+            matrix, ids = self.snapshot.matrix, self.snapshot.ids
+        indices, indptr = [], [0]
+        for features_ in features.values():
+            for feature in features_:
+                indices.append(
+                    self.columns.setdefault(feature, len(self.columns))
+                )
+            indptr.append(len(indices))
+        rows = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(features), len(self.columns))
+        )
+        matrix = sparse.csr_matrix(
+            (matrix.data, matrix.indices, matrix.indptr),
+            shape=(matrix.shape[0], len(self.columns))
+        )
+        self.snapshot = snapshot(
+            sparse.vstack([matrix, rows], format='csr'),
+            np.concatenate([
+                ids,
+                np.fromiter(features, dtype=np.int64, count=len(features))
+            ])
+        )
+
+    def replace(self, recipe_ids):
+        """Reload the rows of recipe_ids (dropping deleted recipes)"""
+        current = self.snapshot
+        keep = ~np.isin(current.ids, list(recipe_ids))
+        self.append(
+            recipe_features(self.user_id, self.using, recipe_ids),
+            current.matrix[keep], current.ids[keep]
+        )
+
+    def update(self):
+        """Apply the changes recorded since this index was built
+
+        Returns False when the index must be rebuilt instead.
+        """
+        seq = change_seq(self.user_id)
+        if seq == self.seq:
+            return True
+        if not self.seq < seq <= self.seq + MAX_CHANGES:
+            return False
+        changes = cache.get_many([
+            CHANGE_KEY.format(self.user_id, n)
+            for n in range(self.seq + 1, seq + 1)
+        ])
+        if len(changes) < seq - self.seq:
+            return False
+        self.replace({pk for ids in changes.values() for pk in ids})
+        self.seq = seq
+        return True
+
+    def similar(self, recipe_id, count):
+        """Return [(recipe id, score)] of the count most similar recipes"""
+        matrix, ids, sizes, row_of = self.snapshot
+        row = row_of.get(recipe_id)
+        if row is None or not sizes[row]:
+            return []
+        common = (matrix @ matrix[row].T).toarray().ravel()
+        union = sizes + sizes[row] - common
+        scores = np.divide(
+            common, union, out=np.zeros_like(common), where=union > 0
+        )
+        scores[row] = 0
+        count = min(count, len(scores) - 1)
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [
+            (int(ids[i]), float(scores[i])) for i in top if scores[i] > 0
+        ]
+
+
+class IndexCache:
+    """Per worker LRU of the SimilarityIndex of recently active users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+        # held while a user's index is built or updated
+        self.user_locks = {}
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+            self.user_locks.clear()
+
+    def get(self, user_id, using):
+        with self.lock:
+            user_lock = self.user_locks.setdefault(user_id, threading.Lock())
+        with user_lock:
+            index = self.indexes.get(user_id)
+            if index is None or index.using != using or not index.update():
+                index = SimilarityIndex(user_id, using)
+        with self.lock:
+            self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > settings.SIMILARITY_INDEX_USERS:
+                evicted, _ = self.indexes.popitem(last=False)
+                self.user_locks.pop(evicted, None)
+        return index
+
+
+index_cache = IndexCache()
+
+
+def similar_recipes(recipe, count=10):
+    """Return [(recipe id, score)] of the recipes most like recipe"""
+    index = index_cache.get(recipe.user_id, recipe._state.db)
+    return index.similar(recipe.pk, count)
@@ -0,0 +1,139 @@
+"""Statistics over a user's recipes
+
+Everything is computed by a handful of grouped queries: one aggregate,
+one value distribution per field (percentiles and histograms are read
+off it) and one breakdown per tag and per ingredient. Results are cached
+under the user's data version, so they are recomputed only after the
+user's recipes, tags or ingredients change.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min, Sum
+
+from core.models import Recipe
+from core.versions import user_data_version
+
+
+STATS_KEY = 'recipe-stats:{}:{}'
+STATS_TIMEOUT = 24 * 60 * 60
+PERCENTILES = (50, 90, 95, 99)
+HISTOGRAM_BUCKETS = 10
+CENTS = Decimal('0.01')
+
+
+def price(value):
+    """Format price values like the recipe serializer does"""
+    return None if value is None else str(Decimal(value).quantize(CENTS))
+
+
+def minutes(value):
+    return None if value is None else round(float(value), 1)
+
+
+FIELDS = (('price', price), ('time_minutes', minutes))
+
+
+def percentiles(distribution, count):
+    """Nearest rank percentiles of a sorted [(value, count)] distribution"""
+    result = {}
+    for p in PERCENTILES:
+        rank = max(1, -(-p * count // 100))
+        seen = 0
+        for value, n in distribution:
+            seen += n
+            if seen >= rank:
+                result[f'p{p}'] = value
+                break
+    return result
+
+
+def histogram(distribution, low, high):
+    """Count the values of distribution in equal width buckets"""
+    if low is None:
+        return []
+    width = (high - low) / HISTOGRAM_BUCKETS
+    counts = [0] * HISTOGRAM_BUCKETS
+    for value, n in distribution:
+        index = int((value - low) / width) if width else 0
+        counts[min(index, HISTOGRAM_BUCKETS - 1)] += n
+    return [
+        {'low': low + width * i, 'high': low + width * (i + 1), 'count': n}
+        for i, n in enumerate(counts)
+    ]
+
+
+def field_stats(recipes, field, summary, fmt):
+    distribution = list(
+        recipes.order_by(field).values_list(field).annotate(n=Count('id'))
+    )
+    low, high = summary[f'{field}_min'], summary[f'{field}_max']
+    return {
+        'mean': fmt(summary[f'{field}_mean']),
+        'min': fmt(low),
+        'max': fmt(high),
+        'total': fmt(summary[f'{field}_total']),
+        'percentiles': {
+            name: fmt(value) for name, value in
+            percentiles(distribution, summary['count']).items()
+        },
+        'histogram': [
+            {
+                'low': fmt(bucket['low']),
+                'high': fmt(bucket['high']),
+                'count': bucket['count'],
+            } for bucket in histogram(distribution, low, high)
+        ],
+    }
+
+
+def breakdown(user, relation, field):
+    """Recipe count and means per tag or ingredient of the user
+
+    Grouped over the M2M table, field being its tag/ingredient column.
+    """
+    attr = f'{field}_id'
+    rows = getattr(Recipe, relation).through.objects.using(
+        Recipe.objects.for_user(user).db
+    ).filter(recipe__user=user).values(attr, f'{field}__name').annotate(
+        count=Count('recipe_id'),
+        price_mean=Avg('recipe__price'),
+        time_minutes_mean=Avg('recipe__time_minutes'),
+    ).order_by('-count', attr)
+    return [{
+        'id': row[attr],
+        'name': row[f'{field}__name'],
+        'count': row['count'],
+        'price_mean': price(row['price_mean']),
+        'time_minutes_mean': minutes(row['time_minutes_mean']),
+    } for row in rows]
+
+
+def compute_recipe_stats(user):
+    recipes = Recipe.objects.for_user(user)
+    aggregates = {'count': Count('id')}
+    for field, _ in FIELDS:
+        aggregates.update({
+            f'{field}_mean': Avg(field),
+            f'{field}_min': Min(field),
+            f'{field}_max': Max(field),
+            f'{field}_total': Sum(field),
+        })
+    summary = recipes.aggregate(**aggregates)
+
+    stats = {'count': summary['count']}
+    for field, fmt in FIELDS:
+        stats[field] = field_stats(recipes, field, summary, fmt)
+    stats['tags'] = breakdown(user, 'tags', 'tag')
+    stats['ingredients'] = breakdown(user, 'ingredients', 'ingredient')
+    return stats
+
+
+def recipe_stats(user):
+    """Return the statistics of user's recipes, from the cache if current"""
+    key = STATS_KEY.format(user.pk, user_data_version(user.pk))
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_recipe_stats(user)
+        cache.set(key, stats, STATS_TIMEOUT)
+    return stats
@@ -0,0 +1,103 @@
+"""Incremental sync: what changed in a user's data since a cursor
+
+Recipes, tags and ingredients carry an indexed updated_at (recipes' also
+moves when their tags or ingredients change) and deletions leave a
+Tombstone, so a sync reads only the rows changed since the client's
+cursor. The cursor is a timestamp in microseconds, SYNC_LAG behind the
+sync time, so rows committed by slower transactions are sent next time
+(possibly twice) rather than missed. Tombstones are kept for
+SYNC_TOMBSTONE_DAYS: older cursors get a full sync.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+from core.sharding import shard_aliases
+from recipe.serializers import (
+    IngredientSerializer, RecipeSerializer, TagSerializer
+)
+
+
+SYNCED = (
+    ('recipes', Recipe, RecipeSerializer),
+    ('tags', Tag, TagSerializer),
+    ('ingredients', Ingredient, IngredientSerializer),
+)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(moment):
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def sync_cursor(now, since=None):
+    """Return the cursor of a sync at now, SYNC_LAG behind it"""
+    return encode_cursor(max(now - settings.SYNC_LAG, since or EPOCH))
+
+
+def decode_cursor(cursor):
+    """Return the moment of cursor, ValueError if it isn't one"""
+    return EPOCH + timedelta(microseconds=int(cursor))
+
+
+def touch_recipes(recipe_ids, using):
+    """Mark recipes changed, for relation changes that don't save them"""
+    Recipe.objects.using(using).filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now()
+    )
+
+
+def record_deletion(instance):
+    """Leave a tombstone for a deleted recipe, tag or ingredient"""
+    Tombstone.objects.using(instance._state.db).create(
+        user_id=instance.user_id,
+        model=instance._meta.model_name,
+        object_id=instance.pk
+    )
+
+
+def changes(user, since=None):
+    """Return the user's rows changed and deleted since the moment since
+
+    Everything (and no deletions) without since, or when since is older
+    than the tombstones kept.
+    """
+    now = timezone.now()
+    if since is not None and \
+            since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+        since = None
+
+    data = {
+        'cursor': sync_cursor(now, since),
+        'full': since is None,
+        'deleted': {name: [] for name, _, _ in SYNCED},
+    }
+    for name, model, serializer_class in SYNCED:
+        queryset = model.objects.for_user(user)
+        if model is Recipe:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        if since is not None:
+            queryset = queryset.filter(updated_at__gt=since)
+        data[name] = serializer_class(queryset, many=True).data
+
+    if since is not None:
+        models = {model._meta.model_name: name for name, model, _ in SYNCED}
+        for model, object_id in Tombstone.objects.for_user(user).filter(
+            deleted_at__gt=since
+        ).values_list('model', 'object_id'):
+            data['deleted'][models[model]].append(object_id)
+    return data
+
+
+def purge_tombstones():
+    """Delete the tombstones older than SYNC_TOMBSTONE_DAYS"""
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    deleted = 0
+    for alias in shard_aliases():
+        count, _ = Tombstone.objects.using(alias).filter(
+            deleted_at__lt=cutoff
+        ).delete()
+        deleted += count
+    return deleted
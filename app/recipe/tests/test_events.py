@@ -0,0 +1,100 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.tests.utils import TransactionTestCase
+from recipe import events
+from recipe.sync import decode_cursor
+
+
+EVENTS_URL = reverse('recipe:events')
+
+
+def parse(chunk):
+    lines = chunk.decode().strip().split('\n')
+    return lines[0].split(': ', 1)[1], json.loads(lines[1].split(': ', 1)[1])
+
+
+@override_settings(
+    EVENT_STREAM_HEARTBEAT_SECONDS=0.05, EVENT_STREAM_MAX_SECONDS=1
+)
+class EventStreamTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def open_stream(self):
+        res = self.client.get(EVENTS_URL, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        stream = iter(res.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        return res, stream
+
+    def test_change_events(self):
+        """Test the user's changes are pushed, others' aren't"""
+        res, stream = self.open_stream()
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        Tag.objects.create(user=other, name='Other')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+        recipe_id = recipe.id
+        recipe.delete()
+
+        name, event = parse(next(stream))
+        self.assertEqual(name, 'recipe')
+        self.assertEqual(
+            (event['action'], event['ids']), ('created', [recipe_id])
+        )
+        name, event = parse(next(stream))
+        self.assertEqual(
+            (event['action'], event['ids']), ('deleted', [recipe_id])
+        )
+        self.assertEqual(next(stream), b': keepalive\n\n')
+        res.close()
+        self.assertEqual(events.bus.subscriptions, {})
+
+    def test_overflow(self):
+        """Test a stream too slow for its events is told to resync"""
+        subscription = events.bus.subscribe(self.user.pk)
+        self.addCleanup(events.bus.unsubscribe, subscription)
+        for i in range(events.QUEUE_SIZE + 1):
+            events.bus.publish(self.user.pk, {'type': 'tag', 'ids': [i]})
+
+        self.assertEqual(subscription.get(0), events.OVERFLOW)
+        self.assertIsNone(subscription.get(0))
+
+    def test_event_cursor_lags(self):
+        """Test event cursors lag behind like the changes endpoint's"""
+        subscription = events.bus.subscribe(self.user.pk)
+        self.addCleanup(events.bus.unsubscribe, subscription)
+        Tag.objects.create(user=self.user, name='Vegan')
+        after = timezone.now()
+
+        event = subscription.get(0)
+        self.assertLessEqual(
+            decode_cursor(event['cursor']), after - settings.SYNC_LAG
+        )
+
+    @override_settings(EVENT_STREAM_MAX_OPEN=1)
+    def test_open_streams_limited(self):
+        """Test streams over the worker's limit are turned away"""
+        res, stream = self.open_stream()
+
+        refused = self.client.get(EVENTS_URL)
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused['Retry-After'], '30')
+        res.close()
+        res, stream = self.open_stream()
+        res.close()
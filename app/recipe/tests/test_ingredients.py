@@ -1,10 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from core.models import Ingredient
+from core.authentication import token_cache
+from core.models import AuthToken, Ingredient
+from core.tests.utils import TestCase
 from recipe.serializers import IngredientSerializer
 
 # the syntax of reverse is 'app:endpoint-name'
@@ -16,6 +18,7 @@ class PublicIngredientAPITest(TestCase):
     """Test the publicly available ingredients"""
 
     def setUp(self):
+        token_cache.clear()
         self.client = APIClient()
 
     def test_login_required(self):
@@ -23,6 +26,22 @@ class PublicIngredientAPITest(TestCase):
         res = self.client.get(INGREDIENTS_URL)
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_adhoc_expiring_tokens(self):
+        """Test the adhoc URL takes expiring tokens, and only while valid"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        token = AuthToken.objects.issue(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.post(CREATE_INGREDIENTS_URL, {'name': 'Lettuce'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        AuthToken.objects.filter(key=token.key).update(
+            expires=timezone.now()
+        )
+        token_cache.clear()
+        res = self.client.post(CREATE_INGREDIENTS_URL, {'name': 'Kale'})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class PrivateIngredientsAPITest(TestCase):
     """Test ingredients can be retriever by authorized user"""
@@ -40,7 +59,7 @@ class PrivateIngredientsAPITest(TestCase):
         Ingredient.objects.create(user=self.user, name='Kale')
         Ingredient.objects.create(user=self.user, name='Salt')
         res = self.client.get(INGREDIENTS_URL)
-        ingredients = Ingredient.objects.all().order_by('-name')
+        ingredients = Ingredient.objects.for_user(self.user).order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
@@ -63,8 +82,7 @@ class PrivateIngredientsAPITest(TestCase):
     def test_create_ingredient(self):
         """Test create ingredient, generic URL"""
         res = self.client.post(INGREDIENTS_URL, {'name': 'Tomato'})
-        exists = Ingredient.objects.filter(
-            user=self.user,
+        exists = Ingredient.objects.for_user(self.user).filter(
             name='Tomato'
         ).exists()
         self.assertTrue(exists)
@@ -80,7 +98,9 @@ class PrivateIngredientsAPITest(TestCase):
         res = self.client.post(CREATE_INGREDIENTS_URL, {'name': 'Lettuce'})
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         # this part is better done using the exists method
-        query_ingredient = Ingredient.objects.filter(name='Lettuce')[0]
+        query_ingredient = Ingredient.objects.for_user(self.user).filter(
+            name='Lettuce'
+        )[0]
         query_name = query_ingredient.name
         query_user_id = query_ingredient.user_id
         self.assertEqual(query_name, 'Lettuce')
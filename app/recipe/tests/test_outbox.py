@@ -0,0 +1,176 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import OutboxEvent, Recipe, Tag
+from core.sharding import shard_for_user
+from core.tests.utils import TestCase, TransactionTestCase
+from recipe import outbox
+
+
+class Webhook(ThreadingHTTPServer):
+    """Local stand-in for the integration, failing the first `fail` posts"""
+
+    def __init__(self, fail=0):
+        super().__init__(('127.0.0.1', 0), WebhookHandler)
+        self.fail = fail
+        self.received = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            failing = self.server.fail > 0
+            self.server.fail -= 1
+            if not failing:
+                self.server.received.append((self.headers, json.loads(body)))
+        self.send_response(500 if failing else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.shard = shard_for_user(self.user)
+        self.events = OutboxEvent.objects.for_user(self.user)
+
+    def start_webhook(self, fail=0):
+        webhook = Webhook(fail)
+        self.addCleanup(webhook.server_close)
+        self.addCleanup(webhook.shutdown)
+        settings = override_settings(
+            OUTBOX_WEBHOOK_URL=webhook.url, OUTBOX_WEBHOOK_SECRET='s3cret'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return webhook
+
+    def test_not_recorded_without_webhook(self):
+        """Test that nothing is recorded when there's no integration"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.assertFalse(self.events.exists())
+
+    def test_coalesced_delivery(self):
+        """Test that repeated changes of an object are delivered once"""
+        webhook = self.start_webhook()
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+        recipe.title = 'Tomato soup'
+        recipe.save()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        tag_id = tag.id
+        tag.delete()
+
+        call_command('dispatch_outbox', once=True, stdout=StringIO())
+
+        bodies = sorted(
+            (body for _, body in webhook.received), key=lambda b: b['type']
+        )
+        self.assertEqual(len(bodies), 2)
+        recipe_body, tag_body = bodies
+        self.assertEqual(recipe_body['action'], 'created')
+        self.assertEqual(recipe_body['data']['title'], 'Tomato soup')
+        self.assertEqual(recipe_body['data']['tags'], [])
+        self.assertEqual(
+            (tag_body['action'], tag_body['object_id'], tag_body['data']),
+            ('deleted', tag_id, None)
+        )
+        headers = webhook.received[0][0]
+        self.assertTrue(headers['X-Event-Id'])
+        self.assertEqual(len(headers['X-Signature']), 64)
+        self.assertFalse(self.events.exists())
+
+    def test_retry_with_backoff(self):
+        """Test that failed deliveries are retried later, then given up"""
+        webhook = self.start_webhook(fail=1)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        self.assertEqual(outbox.dispatch(self.shard), (0, 1))
+        event = self.events.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('500', event.last_error)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        # not due yet
+        self.assertEqual(outbox.dispatch(self.shard), (0, 0))
+
+        self.events.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.dispatch(self.shard), (1, 0))
+        self.assertEqual(webhook.received[0][1]['data']['name'], 'Vegan')
+        self.assertFalse(self.events.exists())
+
+    def test_dead_after_max_attempts(self):
+        """Test that events are marked dead after OUTBOX_MAX_ATTEMPTS"""
+        self.start_webhook(fail=10)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        with override_settings(OUTBOX_MAX_ATTEMPTS=2):
+            for _ in range(2):
+                self.events.update(next_attempt_at=timezone.now())
+                outbox.dispatch(self.shard)
+
+        event = self.events.get()
+        self.assertTrue(event.dead)
+        self.assertEqual(outbox.dispatch(self.shard), (0, 0))
+
+
+@override_settings(OUTBOX_WEBHOOK_URL='http://127.0.0.1:9/')
+class OutboxTransactionTests(TransactionTestCase):
+
+    def test_change_rolled_back_with_event(self):
+        """Test that a change doesn't commit without its outbox event"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with mock.patch.object(
+            outbox, 'OutboxEvent', mock.Mock(**{
+                'objects.using.return_value.bulk_create.side_effect':
+                    DatabaseError('outbox unavailable')
+            })
+        ):
+            with self.assertRaises(DatabaseError):
+                client.post(reverse('recipe:tag-list'), {'name': 'Vegan'})
+
+        self.assertFalse(Tag.objects.for_user(user).exists())
+
+    def test_failed_events_deleted_meanwhile(self):
+        """Test a failure for events deleted during the delivery"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        Tag.objects.create(user=user, name='Vegan')
+        events = OutboxEvent.objects.for_user(user)
+
+        def fail(payload):
+            # e.g. the user is purged
+            events.delete()
+            raise OSError('Connection refused')
+
+        with mock.patch.object(outbox, 'deliver', side_effect=fail):
+            self.assertEqual(outbox.dispatch(shard_for_user(user)), (0, 1))
+        self.assertFalse(events.exists())
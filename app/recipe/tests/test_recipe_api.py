@@ -4,12 +4,16 @@ import tempfile
 
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
 from core.models import Recipe, Tag, Ingredient
+from core.sharding import shard_aliases, shard_for_user
+from core.tests.utils import TempMediaMixin, TestCase
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
@@ -76,7 +80,7 @@ class PrivateAPITest(TestCase):
 
         res = self.client.get(RECIPE_URL)
 
-        recipes = Recipe.objects.all().order_by('-id')
+        recipes = Recipe.objects.for_user(self.user).order_by('-id')
         # many=True for a list view
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -93,15 +97,33 @@ class PrivateAPITest(TestCase):
         sample_recipe(user=self.user)
         res = self.client.get(RECIPE_URL)
         
-        all_recipes = Recipe.objects.all().order_by('-id')
+        all_recipes = [
+            recipe for alias in shard_aliases()
+            for recipe in Recipe.objects.using(alias).order_by('-id')
+        ]
         all_serializer = RecipeSerializer(all_recipes, many=True)
-        authenticated_recipes = Recipe.objects.filter(user=self.user)
+        authenticated_recipes = Recipe.objects.for_user(self.user)
         authenticated_serializer = RecipeSerializer(authenticated_recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 2)
         self.assertEqual(len(all_serializer.data), 3)
         self.assertEqual(res.data, authenticated_serializer.data)
     
+    def test_list_recipes_query_budget(self):
+        """Test that listing recipes doesn't query their relations each"""
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        # over the budget of the list action this raises
+        with override_settings(QUERY_BUDGETS='raise'):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 5)
+        self.assertEqual(len(res.data[0]['tags']), 1)
+
     def test_view_recipe_detail(self):
         """Test viewing a recipe detail"""
         recipe = sample_recipe(user=self.user)
@@ -126,7 +148,7 @@ class PrivateAPITest(TestCase):
         res = self.client.post(RECIPE_URL, payload)
         
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
         for key in payload:
             self.assertEqual(getattr(recipe, key), payload[key])
     
@@ -143,7 +165,7 @@ class PrivateAPITest(TestCase):
         res = self.client.post(RECIPE_URL, payload)
         
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
         # returns all associated tags
         tags = recipe.tags.all()
         self.assertEqual(tags.count(), 2)
@@ -163,7 +185,7 @@ class PrivateAPITest(TestCase):
         res = self.client.post(RECIPE_URL, payload)
         
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        recipe = Recipe.objects.get(id=res.data['id'])
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
         # returns all associated ingredients
         ingredients = recipe.ingredients.all()
         self.assertEqual(ingredients.count(), 2)
@@ -204,8 +226,92 @@ class PrivateAPITest(TestCase):
         self.assertEqual(recipe.price, payload['price'])
         self.assertEqual(len(recipe.tags.all()), 0)
 
+    def test_create_recipe_with_names(self):
+        """Test creating a recipe with tags and ingredients by name"""
+        existing = sample_tag(user=self.user, name='Vegan')
+        other_user = get_user_model().objects.create_user(
+            'other@mail.com',
+            'pass12345'
+        )
+        sample_ingredient(user=other_user, name='Tofu')
+        payload = {
+            'title': 'Tofu bowl',
+            'time_minutes': 15,
+            'price': 7.00,
+            'tag_names': ['Vegan', 'Quick'],
+            'ingredient_names': ['Tofu', 'Rice', 'Tofu']
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
+        tags = recipe.tags.all()
+        self.assertEqual(tags.count(), 2)
+        self.assertIn(existing, tags)
+        ingredients = recipe.ingredients.all()
+        self.assertEqual(
+            sorted(ingredient.name for ingredient in ingredients),
+            ['Rice', 'Tofu']
+        )
+        # names are resolved among the user's objects only
+        for ingredient in ingredients:
+            self.assertEqual(ingredient.user, self.user)
+
+    def test_create_recipe_names_ignore_case(self):
+        """Test that names match the user's objects whatever their case"""
+        existing = sample_tag(user=self.user, name='Vegan')
+        payload = {
+            'title': 'Tofu bowl',
+            'time_minutes': 15,
+            'price': 7.00,
+            'tag_names': ['vegan', 'Quick', 'QUICK']
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.for_user(self.user).get(id=res.data['id'])
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()), ['Quick', 'Vegan']
+        )
+        self.assertIn(existing, recipe.tags.all())
+        self.assertEqual(Tag.objects.for_user(self.user).count(), 2)
+
+    def test_create_recipe_names_fixed_queries(self):
+        """Test that the number of queries doesn't depend on the names"""
+        shard = connections[shard_for_user(self.user)]
+
+        def create(count):
+            payload = {
+                'title': 'Stew',
+                'time_minutes': 90,
+                'price': 9.00,
+                'tag_names': [f'Tag {count} {i}' for i in range(count)],
+                'ingredient_names': [
+                    f'Ingredient {count} {i}' for i in range(count)
+                ]
+            }
+            with CaptureQueriesContext(shard) as queries:
+                res = self.client.post(RECIPE_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(create(2), create(20))
+
+    def test_partial_update_recipe_names(self):
+        """Test replacing the tags of a recipe by name"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        payload = {'tag_names': ['Dessert']}
+
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag.name for tag in recipe.tags.all()], ['Dessert']
+        )
+
 
-class RecipeImageUploadTest(TestCase):
+class RecipeImageUploadTest(TempMediaMixin, TestCase):
     """Test"""
 
     def setUp(self):
@@ -0,0 +1,199 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, OutboxEvent, Recipe, Tag, Tombstone
+from core.tests.utils import TestCase, TransactionTestCase
+from core.versions import user_data_version
+from recipe import documents, events
+
+
+BULK_UPDATE_URL = reverse('recipe:recipe-bulk-update')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+
+
+class BulkRecipeTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipes = [
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=10, price=5
+            ) for i in range(3)
+        ]
+        self.recipes[0].tags.add(self.vegan)
+        self.recipes[1].tags.add(self.vegan, self.quick)
+
+    def post(self, url, payload):
+        return self.client.post(url, payload, format='json')
+
+    def test_bulk_update_fields_and_tags(self):
+        """Test changing the recipes with a tag, in one go"""
+        res = self.post(BULK_UPDATE_URL, {
+            'filter': {'tags': [self.vegan.id]},
+            'set': {'price': '7.50'},
+            'add_tags': [self.quick.id],
+            'add_ingredients': [self.salt.id],
+            'remove_tags': [self.vegan.id],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        first, second, third = self.recipes
+        self.assertEqual(sorted(res.data['updated']), [first.id, second.id])
+        for recipe in (first, second):
+            recipe.refresh_from_db()
+            self.assertEqual(str(recipe.price), '7.50')
+            self.assertEqual(list(recipe.tags.all()), [self.quick])
+            self.assertEqual(list(recipe.ingredients.all()), [self.salt])
+        third.refresh_from_db()
+        self.assertEqual(third.price, 5)
+        self.assertGreater(first.updated_at, third.updated_at)
+
+    def test_bulk_update_fixed_queries(self):
+        """Test that the queries don't depend on the number of recipes"""
+        def update(ids):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.post(BULK_UPDATE_URL, {
+                    'filter': {'ids': ids},
+                    'set': {'title': 'Renamed'},
+                    'add_tags': [self.quick.id, self.vegan.id],
+                })
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        more = [
+            Recipe.objects.create(
+                user=self.user, title='More', time_minutes=1, price=1
+            ).id for _ in range(10)
+        ]
+        self.assertEqual(update([self.recipes[2].id]), update(more))
+
+    def test_bulk_update_other_users(self):
+        """Test that other users' recipes and tags are left alone"""
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        theirs = Recipe.objects.create(
+            user=other, title='Theirs', time_minutes=1, price=1
+        )
+        their_tag = Tag.objects.create(user=other, name='Theirs')
+
+        res = self.post(BULK_UPDATE_URL, {
+            'filter': {'ids': [theirs.id]}, 'set': {'title': 'Mine'}
+        })
+        self.assertEqual(res.data['updated'], [])
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.title, 'Theirs')
+
+        res = self.post(BULK_UPDATE_URL, {
+            'filter': {'ids': [self.recipes[0].id]},
+            'add_tags': [their_tag.id],
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('add_tags', res.data)
+
+    def test_bulk_invalid(self):
+        """Test that a selection and a change are required"""
+        res = self.post(BULK_UPDATE_URL, {'set': {'title': 'All'}})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.post(BULK_UPDATE_URL, {'filter': {'ids': [1]}})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.post(BULK_DELETE_URL, {'filter': {}})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.for_user(self.user).count(), 3)
+
+    @override_settings(OUTBOX_WEBHOOK_URL='http://127.0.0.1:9/')
+    def test_bulk_delete(self):
+        """Test deleting recipes, leaving tombstones and outbox events"""
+        first, second, third = self.recipes
+        res = self.post(BULK_DELETE_URL, {
+            'filter': {'ids': [first.id, third.id]}
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(res.data['deleted']), [first.id, third.id])
+        self.assertEqual(list(Recipe.objects.for_user(self.user)), [second])
+        self.assertEqual(
+            Recipe.tags.through.objects.using(second._state.db).filter(
+                recipe_id=first.id
+            ).count(), 0
+        )
+        self.assertEqual(
+            set(Tombstone.objects.for_user(self.user).values_list(
+                'model', 'object_id'
+            )),
+            {('recipe', first.id), ('recipe', third.id)}
+        )
+        self.assertEqual(
+            set(OutboxEvent.objects.for_user(self.user).values_list(
+                'action', 'object_id'
+            )),
+            {('deleted', first.id), ('deleted', third.id)}
+        )
+        self.assertTrue(
+            Tag.objects.for_user(self.user).filter(pk=self.vegan.pk).exists()
+        )
+
+
+class BulkRecipeEventTests(TransactionTestCase):
+
+    def test_bulk_update_version(self):
+        """Test a bulk change moves the user's data version on commit"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=1, price=1
+        )
+        version = user_data_version(user.pk)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        client.post(BULK_UPDATE_URL, {
+            'filter': {'ids': [recipe.id]}, 'set': {'price': '2.00'}
+        }, format='json')
+
+        self.assertGreater(user_data_version(user.pk), version)
+
+    @override_settings(RECIPE_DOCUMENTS=True)
+    def test_bulk_update_documents(self):
+        """Test the documents of bulk updated recipes are rebuilt"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=1, price=1
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        client.post(BULK_UPDATE_URL, {
+            'filter': {'ids': [recipe.id]}, 'set': {'title': 'Stew'}
+        }, format='json')
+
+        body, _ = documents.get_document(user, recipe.id)
+        self.assertIn(b'"Stew"', body)
+
+    def test_bulk_events(self):
+        """Test that a bulk change publishes one event for all recipes"""
+        user = get_user_model().objects.create_user('test@test.com', 'pw')
+        ids = [
+            Recipe.objects.create(
+                user=user, title='Soup', time_minutes=1, price=1
+            ).id for _ in range(3)
+        ]
+        subscription = events.bus.subscribe(user.pk)
+        self.addCleanup(events.bus.unsubscribe, subscription)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        client.post(BULK_DELETE_URL, {'filter': {'ids': ids}}, format='json')
+
+        event = subscription.get(timeout=1)
+        self.assertEqual(event['action'], 'deleted')
+        self.assertEqual(sorted(event['ids']), ids)
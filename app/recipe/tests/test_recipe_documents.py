@@ -0,0 +1,136 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, RecipeDocument, Tag
+from core.tests.utils import TransactionTestCase
+from recipe.documents import DocumentRequest, render_document
+from recipe.serializers import RecipeDetailSerializer
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def stored(recipe):
+    document = RecipeDocument.objects.using(recipe._state.db).get(
+        recipe=recipe
+    )
+    return json.loads(bytes(document.body))
+
+
+@override_settings(
+    RECIPE_DOCUMENTS=True, RECIPE_DOCUMENTS_BASE_URL='http://testserver'
+)
+class RecipeDocumentTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price='7.00'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Spicy')
+        self.recipe.tags.add(self.tag)
+
+    def test_retrieve_one_query(self):
+        """Test the detail is the stored document, read in one query"""
+        with self.assertNumQueries(1, using=self.recipe._state.db):
+            res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.json(), json.loads(json.dumps(
+                RecipeDetailSerializer(self.recipe).data
+            ))
+        )
+
+    def test_retrieve_not_modified(self):
+        """Test that documents carry an ETag, changed by rebuilds"""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.recipe.title = 'Green curry'
+        self.recipe.save()
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_other_users_recipe(self):
+        """Test documents of other users' recipes aren't served"""
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        self.client.force_authenticate(other)
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rebuilt_on_changes(self):
+        """Test documents follow recipe, tag and ingredient changes"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        salt.recipe_set.add(self.recipe)
+        self.assertEqual(stored(self.recipe)['ingredients'][0]['name'], 'Salt')
+
+        self.tag.name = 'Hot'
+        self.tag.save()
+        self.assertEqual(stored(self.recipe)['tags'][0]['name'], 'Hot')
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Red curry'})
+        self.assertEqual(stored(self.recipe)['title'], 'Red curry')
+
+        salt.recipe_set.clear()
+        self.tag.delete()
+        document = stored(self.recipe)
+        self.assertEqual(document['ingredients'], [])
+        self.assertEqual(document['tags'], [])
+
+    def test_served_for_base_url(self):
+        """Test documents only go to requests for their base URL"""
+        self.assertEqual(
+            DocumentRequest().build_absolute_uri('/media/cake.jpg'),
+            'http://testserver/media/cake.jpg'
+        )
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIn('ETag', res)
+
+        # absolute URLs would be another origin's, use the serializer
+        with self.settings(RECIPE_DOCUMENTS_BASE_URL='https://testserver'):
+            res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', res)
+
+    def test_rebuilt_once_per_transaction(self):
+        """Test a recipe created with tags and ingredients renders once"""
+        with patch(
+            'recipe.documents.render_document', wraps=render_document
+        ) as render:
+            res = self.client.post(reverse('recipe:recipe-list'), {
+                'title': 'Soup', 'time_minutes': 20, 'price': '4.00',
+                'tag_names': ['Vegan'], 'ingredient_names': ['Leek'],
+            }, format='json')
+
+        self.assertEqual(render.call_count, 1)
+        document = stored(
+            Recipe.objects.for_user(self.user).get(pk=res.data['id'])
+        )
+        self.assertEqual(document['tags'][0]['name'], 'Vegan')
+        self.assertEqual(document['ingredients'][0]['name'], 'Leek')
+
+    def test_rebuild_command(self):
+        """Test the command backfills missing documents"""
+        RecipeDocument.objects.for_user(self.user).delete()
+        call_command('rebuild_recipe_documents', stdout=StringIO())
+        self.assertEqual(stored(self.recipe)['title'], 'Curry')
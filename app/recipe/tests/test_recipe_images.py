@@ -0,0 +1,185 @@
+import hashlib
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ImageBlob, Recipe, UserShard
+from core.tests.utils import TempMediaMixin, TestCase, TransactionTestCase
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ContentAddressedImageTests(TempMediaMixin, TransactionTestCase):
+    """Test recipe images are stored once per content"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipes = [
+            Recipe.objects.create(
+                user=self.user, title=f'Cake {i}', time_minutes=5, price=5
+            ) for i in range(2)
+        ]
+
+    def upload(self, recipe, color='red'):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10), color).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(recipe.id), {'image': ntf},
+                format='multipart'
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        return recipe.image
+
+    def test_identical_uploads_stored_once(self):
+        """Test the same image uploaded twice is written once"""
+        with patch('core.storage.os.replace', wraps=os.replace) as write:
+            first = self.upload(self.recipes[0])
+            second = self.upload(self.recipes[1])
+
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(ImageBlob.objects.get(name=first.name).refs, 2)
+
+        self.client.delete(detail_url(self.recipes[0].id))
+        self.assertTrue(os.path.exists(second.path))
+        self.client.delete(detail_url(self.recipes[1].id))
+        self.assertFalse(os.path.exists(second.path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_replace_image_drops_reference(self):
+        """Test replacing an image releases the old file"""
+        old = self.upload(self.recipes[0])
+        new = self.upload(self.recipes[0], color='blue')
+
+        self.assertNotEqual(old.name, new.name)
+        self.assertFalse(os.path.exists(old.path))
+        self.assertEqual(
+            list(ImageBlob.objects.values_list('name', flat=True)),
+            [new.name]
+        )
+        self.recipes[0].image.delete()
+
+    def test_same_image_uploaded_again(self):
+        """Test uploading a recipe's own image again keeps one reference"""
+        first = self.upload(self.recipes[0])
+        second = self.upload(self.recipes[0])
+
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(ImageBlob.objects.get(name=first.name).refs, 1)
+
+        self.client.delete(detail_url(self.recipes[0].id))
+        self.assertFalse(os.path.exists(second.path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    @skipUnless(
+        'shard1' in settings.SHARD_DATABASES,
+        'run with DB_SHARDS=shard1 to test references across databases'
+    )
+    def test_rolled_back_save_no_reference(self):
+        """Test a recipe image save rolled back takes no reference"""
+        user = get_user_model().objects.create_user(
+            'other@test.com', 'testpass'
+        )
+        UserShard.objects.create(user=user, alias='shard1')
+        cache.clear()
+        recipe = Recipe.objects.create(
+            user=user, title='Cake', time_minutes=5, price=5
+        )
+        with transaction.atomic(using='shard1'):
+            recipe.image.save('cake.jpg', ContentFile(b'cake'))
+            transaction.set_rollback(True, using='shard1')
+
+        self.assertFalse(ImageBlob.objects.filter(refs__gt=0).exists())
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_large_upload_hashed_once(self):
+        """Test an upload too large for memory is hashed once"""
+        hashers, new_hasher = [], hashlib.sha256
+
+        def sha256(*args):
+            hashers.append(Mock(wraps=new_hasher(*args)))
+            return hashers[-1]
+
+        with patch('core.uploads.hashlib.sha256', sha256):
+            image = self.upload(self.recipes[0])
+
+        hashed = sum(
+            len(call[0][0]) for hasher in hashers
+            for call in hasher.update.call_args_list
+        )
+        self.assertEqual(hashed, image.size)
+
+
+class GarbageCollectImagesTests(TempMediaMixin, TestCase):
+    """Test removing image files no recipe uses"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('gc@test.com', 'pass')
+        self.recipe = Recipe.objects.create(
+            user=user, title='Cake', time_minutes=5, price=5
+        )
+        self.recipe.image.save('used.jpg', ContentFile(b'used'))
+        self.old = default_storage.save(
+            'upload/recipe/orphan.jpg', ContentFile(b'orphan')
+        )
+        self.new = default_storage.save(
+            'upload/recipe/ab/fresh.jpg', ContentFile(b'fresh')
+        )
+        two_days_ago = time.time() - 2 * 24 * 60 * 60
+        for name in (self.recipe.image.name, self.old):
+            os.utime(default_storage.path(name), (two_days_ago,) * 2)
+
+    def tearDown(self):
+        self.recipe.image.delete()
+        for name in (self.old, self.new):
+            default_storage.delete(name)
+
+    def test_gc_images(self):
+        """Test only old orphans are deleted"""
+        out = StringIO()
+        call_command('gc_recipe_images', batch_size=1, stdout=out)
+
+        self.assertFalse(default_storage.exists(self.old))
+        self.assertTrue(default_storage.exists(self.new))
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+        self.assertIn('Reclaimed 6 bytes from 1 orphaned images',
+                      out.getvalue())
+
+    def test_gc_images_quarantine(self):
+        """Test orphans can be moved aside instead"""
+        with tempfile.TemporaryDirectory() as quarantine:
+            call_command(
+                'gc_recipe_images', quarantine=quarantine, stdout=StringIO()
+            )
+            self.assertTrue(
+                os.path.exists(os.path.join(quarantine, self.old))
+            )
+        self.assertFalse(default_storage.exists(self.old))
@@ -0,0 +1,148 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.tests.utils import TempMediaMixin, TestCase
+from recipe import renditions
+
+
+def image_url(recipe_id):
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
+
+def png(width, height):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), 'green').save(out, format='PNG')
+    return out.getvalue()
+
+
+class RenditionTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        settings = override_settings(RENDITION_CACHE_DIR=self.cache_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.cache_dir.cleanup)
+
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Cake', time_minutes=5, price=5
+        )
+        self.recipe.image.save('cake.png', ContentFile(png(800, 400)))
+        self.addCleanup(self.recipe.image.delete)
+
+    def test_resized_rendition(self):
+        """Test images are resized to the next configured width"""
+        res = self.client.get(image_url(self.recipe.id), {
+            'width': 300, 'fmt': 'png'
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/png')
+        image = Image.open(io.BytesIO(b''.join(res.streaming_content)))
+        self.assertEqual(image.size, (320, 160))
+
+        res = self.client.get(
+            image_url(self.recipe.id), {'width': 300, 'fmt': 'png'},
+            HTTP_IF_NONE_MATCH=res['ETag']
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid_parameters(self):
+        """Test unknown formats and bad widths are rejected"""
+        url = image_url(self.recipe.id)
+        res = self.client.get(url, {'width': 'wide'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(url, {'fmt': 'bmp'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unreadable_original(self):
+        """Test missing and corrupt originals are client errors"""
+        url = image_url(self.recipe.id)
+        with open(self.recipe.image.path, 'wb') as image:
+            image.write(b'not an image')
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        os.remove(self.recipe.image.path)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RENDITION_CACHE_MAX_BYTES=250)
+    def test_lru_eviction(self):
+        """Test the least recently used renditions go over the size cap"""
+        cache = renditions.rendition_cache
+        for age, key in enumerate(['cc-new', 'bb-used', 'aa-old']):
+            path = cache.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'x' * 100)
+            os.utime(path, (time.time() - age * 60,) * 2)
+
+        cache.added(100)
+
+        self.assertEqual(
+            sorted(entry.name for entry in cache.entries()),
+            ['bb-used', 'cc-new']
+        )
+        self.assertEqual(cache.stored_size(), 200)
+
+    @override_settings(RENDITION_CACHE_MAX_BYTES=250)
+    def test_size_shared_by_workers(self):
+        """Test the cap holds for the bytes stored by all the workers"""
+        workers = [renditions.RenditionCache() for _ in range(3)]
+        for age, (worker, key) in enumerate(
+            zip(workers, ['aa-old', 'bb-used', 'cc-new'])
+        ):
+            path = worker.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'x' * 100)
+            os.utime(path, (time.time() - (2 - age) * 60,) * 2)
+            worker.added(100)
+
+        self.assertEqual(
+            sorted(entry.name for entry in workers[0].entries()),
+            ['bb-used', 'cc-new']
+        )
+        self.assertEqual(workers[0].stored_size(), 200)
+
+    def test_concurrent_requests_render_once(self):
+        """Test a rendition wanted by several threads is made once"""
+        render = renditions.render
+
+        def slow_render(*args):
+            time.sleep(0.1)
+            return render(*args)
+
+        def fetch():
+            renditions.open_rendition(
+                self.recipe.image.name, self.recipe.image.path, 640, 'jpeg'
+            ).close()
+
+        with patch('recipe.renditions.render', side_effect=slow_render) as \
+                mock_render:
+            threads = [threading.Thread(target=fetch) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(mock_render.call_count, 1)
@@ -0,0 +1,137 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from core.tests.utils import TestCase, TransactionTestCase
+from recipe.similarity import index_cache, recipe_features
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_recipe(user, title, ingredients=(), tags=()):
+    recipe = Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5
+    )
+    recipe.ingredients.set(ingredients)
+    recipe.tags.set(tags)
+    return recipe
+
+
+class SimilarRecipesMixin:
+
+    def setUp(self):
+        cache.clear()
+        index_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.flour, self.egg, self.milk, self.fish = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Flour', 'Egg', 'Milk', 'Fish')
+        ]
+        self.sweet = Tag.objects.create(user=self.user, name='Sweet')
+        self.cake = sample_recipe(
+            self.user, 'Cake', [self.flour, self.egg, self.milk], [self.sweet]
+        )
+        self.pancake = sample_recipe(
+            self.user, 'Pancake', [self.flour, self.egg, self.milk]
+        )
+        self.bread = sample_recipe(self.user, 'Bread', [self.flour])
+        self.sushi = sample_recipe(self.user, 'Sushi', [self.fish])
+
+    def similar(self, recipe):
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(item['title'], item['similarity']) for item in res.data]
+
+
+class SimilarRecipesTests(SimilarRecipesMixin, TestCase):
+
+    def test_similar_recipes(self):
+        """Test recipes are ranked by the Jaccard index of their features"""
+        self.assertEqual(
+            self.similar(self.cake), [('Pancake', 0.75), ('Bread', 0.25)]
+        )
+        self.assertEqual(self.similar(self.sushi), [])
+
+    def test_other_users_recipes(self):
+        """Test only the user's recipes are compared"""
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        sample_recipe(other, 'Other cake', [self.flour, self.egg])
+        self.assertEqual(len(self.similar(self.cake)), 2)
+
+        self.client.force_authenticate(other)
+        res = self.client.get(similar_url(self.cake.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SimilarRecipesUpdateTests(SimilarRecipesMixin, TransactionTestCase):
+
+    def test_incremental_update(self):
+        """Test changed recipes are reloaded into the cached matrix"""
+        self.similar(self.cake)
+        index = index_cache.indexes[self.user.id]
+
+        self.sushi.ingredients.add(self.flour, self.egg, self.milk)
+        self.pancake.delete()
+        muffin = sample_recipe(
+            self.user, 'Muffin', [self.flour, self.egg, self.milk],
+            [self.sweet]
+        )
+
+        self.assertEqual(self.similar(self.cake)[:2], [
+            ('Muffin', 1.0), ('Sushi', 0.6)
+        ])
+        self.assertIs(index_cache.indexes[self.user.id], index)
+        self.assertIn(muffin.id, index.snapshot.row_of)
+        self.assertNotIn(self.pancake.id, index.snapshot.row_of)
+
+    def test_read_during_update(self):
+        """Test readers see the old matrix whole until an update is done"""
+        self.similar(self.cake)
+        index = index_cache.indexes[self.user.id]
+        self.bread.ingredients.add(self.egg, self.milk)
+        seen = []
+
+        def features(*args):
+            # a reader, between the start and the end of the update
+            seen.append(index.similar(self.cake.id, 3))
+            return recipe_features(*args)
+
+        with patch('recipe.similarity.recipe_features', features):
+            index.update()
+
+        self.assertEqual(seen, [
+            [(self.pancake.id, 0.75), (self.bread.id, 0.25)]
+        ])
+        self.assertCountEqual(index.similar(self.cake.id, 3), [
+            (self.pancake.id, 0.75), (self.bread.id, 0.75)
+        ])
+
+    def test_tag_deleted(self):
+        """Test deleting a tag reloads the recipes that had it"""
+        self.similar(self.cake)
+
+        self.sweet.delete()
+
+        self.assertEqual(self.similar(self.cake)[0], ('Pancake', 1.0))
+
+    def test_rebuild_after_gap(self):
+        """Test the matrix is rebuilt when changes are missing"""
+        self.similar(self.cake)
+        index = index_cache.indexes[self.user.id]
+
+        self.bread.ingredients.add(self.egg, self.milk)
+        cache.delete(f'recipe-changes:{self.user.id}:{index.seq + 1}')
+
+        self.assertEqual(self.similar(self.cake)[1], ('Bread', 0.75))
+        self.assertIsNot(index_cache.indexes[self.user.id], index)
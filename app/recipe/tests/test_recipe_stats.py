@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from core.tests.utils import TransactionTestCase
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+class RecipeStatsTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        for minutes, price in ((10, '5.00'), (20, '10.00'), (60, '30.00')):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {minutes}',
+                time_minutes=minutes, price=price
+            )
+            recipe.ingredients.add(self.salt)
+            if minutes < 60:
+                recipe.tags.add(self.vegan)
+
+    def test_stats(self):
+        """Test aggregates over the user's recipes only"""
+        other = get_user_model().objects.create_user('other@test.com', 'pass')
+        Recipe.objects.create(
+            user=other, title='Other', time_minutes=500, price='99.00'
+        )
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        self.assertEqual(res.data['price']['mean'], '15.00')
+        self.assertEqual(res.data['price']['total'], '45.00')
+        self.assertEqual(res.data['time_minutes']['max'], 60)
+        self.assertEqual(res.data['time_minutes']['percentiles']['p50'], 20)
+        histogram = res.data['time_minutes']['histogram']
+        self.assertEqual(histogram[0], {'low': 10, 'high': 15, 'count': 1})
+        self.assertEqual(sum(bucket['count'] for bucket in histogram), 3)
+        self.assertEqual(res.data['tags'], [{
+            'id': self.vegan.id, 'name': 'Vegan', 'count': 2,
+            'price_mean': '7.50', 'time_minutes_mean': 15.0,
+        }])
+        self.assertEqual(res.data['ingredients'][0]['count'], 3)
+
+    def test_stats_no_recipes(self):
+        """Test stats of a user without recipes"""
+        self.client.force_authenticate(
+            get_user_model().objects.create_user('new@test.com', 'pass')
+        )
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 0)
+        self.assertIsNone(res.data['price']['mean'])
+        self.assertEqual(res.data['price']['histogram'], [])
+
+    def test_stats_cached_until_change(self):
+        """Test stats are cached until the user's data changes"""
+        self.client.get(STATS_URL)
+        with self.assertNumQueries(0):
+            self.client.get(STATS_URL)
+
+        self.vegan.name = 'Plant based'
+        self.vegan.save()
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['tags'][0]['name'], 'Plant based')
+
+        Recipe.objects.for_user(self.user).first().tags.clear()
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['tags'][0]['count'], 1)
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe
+from core.tests.utils import TestCase
+
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+class ShoppingListTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.salt, self.rice, self.fish = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'Rice', 'Fish')
+        ]
+        self.recipes = []
+        for ingredients in ([self.salt, self.rice], [self.salt, self.fish],
+                            [self.rice]):
+            recipe = Recipe.objects.create(
+                user=self.user, title='Dish', time_minutes=10, price=5
+            )
+            recipe.ingredients.set(ingredients)
+            self.recipes.append(recipe)
+
+    def get(self, *recipes):
+        return self.client.get(SHOPPING_LIST_URL, {
+            'ids': ','.join(str(recipe.id) for recipe in recipes)
+        })
+
+    def test_shopping_list(self):
+        """Test ingredients are listed once, with their recipes"""
+        first, second, _ = self.recipes
+        with self.assertNumQueries(1, using=first._state.db):
+            res = self.get(first, second)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.fish.id, 'name': 'Fish', 'recipes': [second.id]},
+            {'id': self.rice.id, 'name': 'Rice', 'recipes': [first.id]},
+            {'id': self.salt.id, 'name': 'Salt',
+             'recipes': [first.id, second.id]},
+        ])
+
+    def test_other_users_recipes_ignored(self):
+        """Test recipes of other users aren't listed"""
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        self.client.force_authenticate(other)
+        res = self.get(*self.recipes)
+        self.assertEqual(res.data, [])
+
+    def test_invalid_ids(self):
+        """Test the ids must be a list of numbers"""
+        res = self.client.get(SHOPPING_LIST_URL, {'ids': '1,two'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(SHOPPING_LIST_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+from core.tests.utils import TestCase
+from recipe import sync
+
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+@override_settings(SYNC_LAG=timedelta(0))
+class SyncTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=10, price=5
+        )
+        self.recipe.tags.add(self.tag)
+
+    def changes(self, cursor=None):
+        res = self.client.get(CHANGES_URL, {'since': cursor or ''})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_full_sync(self):
+        """Test everything is returned without a cursor"""
+        data = self.changes()
+
+        self.assertTrue(data['full'])
+        self.assertEqual(data['recipes'][0]['tags'], [self.tag.id])
+        self.assertEqual(len(data['tags']), 1)
+        self.assertEqual(len(data['ingredients']), 1)
+
+    def test_changes_since_cursor(self):
+        """Test only rows changed or deleted since the cursor are sent"""
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        cursor = self.changes()['cursor']
+        Tag.objects.create(user=other, name='Other')
+
+        self.assertEqual(self.changes(cursor)['recipes'], [])
+
+        self.salt.recipe_set.add(self.recipe)
+        tag_id = self.tag.id
+        self.tag.delete()
+        data = self.changes(cursor)
+
+        self.assertFalse(data['full'])
+        self.assertEqual(
+            data['recipes'][0]['ingredients'], [self.salt.id]
+        )
+        self.assertEqual(data['recipes'][0]['tags'], [])
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(data['ingredients'], [])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+
+    def test_old_cursor_full_sync(self):
+        """Test cursors older than the tombstones get a full sync"""
+        cursor = sync.encode_cursor(timezone.now() - timedelta(days=90))
+        self.assertTrue(self.changes(cursor)['full'])
+
+    def test_invalid_cursor(self):
+        """Test invalid cursors are rejected"""
+        res = self.client.get(CHANGES_URL, {'since': 'yesterday'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_tombstones(self):
+        """Test old tombstones are deleted"""
+        self.recipe.delete()
+        Tombstone.objects.for_user(self.user).update(
+            deleted_at=timezone.now() - timedelta(days=60)
+        )
+
+        self.assertEqual(sync.purge_tombstones(), 1)
@@ -1,14 +1,18 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
-from django.test import TestCase
+from django.test import override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag
+from core.tests.utils import TestCase, TransactionTestCase
+from recipe.autocomplete import index_cache
 from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsApiTests(TestCase):
@@ -40,7 +44,7 @@ class PrivateTagsApiTests(TestCase):
         Tag.objects.create(user=self.user, name='Dessert')
 
         res = self.client.get(TAGS_URL)
-        tags = Tag.objects.all().order_by('-name')
+        tags = Tag.objects.for_user(self.user).order_by('-name')
         # many=True important for list of objects
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -64,8 +68,7 @@ class PrivateTagsApiTests(TestCase):
         """Test creating a new tag"""
         payload = {'name': 'Test tag'}
         self.client.post(TAGS_URL, payload)
-        exists = Tag.objects.filter(
-            user=self.user,
+        exists = Tag.objects.for_user(self.user).filter(
             name=payload['name']
         ).exists()
         self.assertTrue(exists)
@@ -75,3 +78,59 @@ class PrivateTagsApiTests(TestCase):
         payload = {'name': ''}
         res = self.client.post(TAGS_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TagAutocompleteTests(TransactionTestCase):
+    """Test tag name autocompletion"""
+
+    def setUp(self):
+        cache.clear()
+        index_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'pass1234'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ('Sweet', 'Bittersweet', 'Savory', 'sweet and sour'):
+            Tag.objects.create(user=self.user, name=name)
+        other = get_user_model().objects.create_user('other@test.com', 'pw')
+        Tag.objects.create(user=other, name='Sweets')
+
+    def complete(self, q, **params):
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': q, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in res.data]
+
+    def test_autocomplete(self):
+        """Test prefix matches come first, then substring matches"""
+        self.assertEqual(
+            self.complete('SWE'), ['Sweet', 'sweet and sour', 'Bittersweet']
+        )
+        self.assertEqual(self.complete('swe', limit=1), ['Sweet'])
+        self.assertEqual(self.complete(''), [])
+
+    @override_settings(AUTOCOMPLETE_MEMORY_INDEX=True)
+    def test_autocomplete_memory_index(self):
+        """Test the in-memory index, refreshed when tags change"""
+        self.assertEqual(
+            self.complete('SWE'), ['Sweet', 'sweet and sour', 'Bittersweet']
+        )
+        with self.assertNumQueries(0):
+            self.complete('sav')
+
+        Tag.objects.create(user=self.user, name='Swedish')
+        self.assertEqual(self.complete('swe')[0], 'Swedish')
+
+    def test_autocomplete_same_order(self):
+        """Test the database and the memory index order names alike"""
+        for name in ('apple pie', 'Avocado', 'Apple', 'banana split'):
+            Tag.objects.create(user=self.user, name=name)
+        expected = [
+            'Apple', 'apple pie', 'Avocado', 'banana split', 'Savory',
+            'sweet and sour'
+        ]
+
+        self.assertEqual(self.complete('a'), expected)
+        with override_settings(AUTOCOMPLETE_MEMORY_INDEX=True):
+            self.assertEqual(self.complete('a'), expected)
@@ -13,6 +13,8 @@ app_name = 'recipe'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('changes/', views.ChangesView.as_view(), name='changes'),
+    path('events/', views.EventStreamView.as_view(), name='events'),
     path('ingredient-create',
          views_old.IngredientCreateView.as_view(),
          name='ingredient-create')
@@ -1,30 +1,71 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from core.authentication import ExpiringTokenAuthentication
+from core.idempotency import IdempotentCreateMixin
+from core.sharding import shard_for_user
 from core.models import Tag, Ingredient, Recipe
+from recipe import bulk, documents, events, sync
+from recipe.autocomplete import complete_names
+from recipe.renditions import (
+    FORMATS, open_rendition, rendition_key, rendition_width
+)
+from recipe.shopping import shopping_list
+from recipe.similarity import similar_recipes
+from recipe.stats import recipe_stats
 from recipe.serializers import (
     RecipeDetailSerializer, TagSerializer, IngredientSerializer, 
-    RecipeSerializer, RecipeImageSerializer
+    RecipeSerializer, RecipeImageSerializer, RecipeBulkUpdateSerializer,
+    RecipeBulkDeleteSerializer
 )
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+SHOPPING_LIST_MAX_RECIPES = 500
+BULK_MAX_RECIPES = 500
+
+
+class BaseRecipeAttrViewSet(IdempotentCreateMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base view set for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # see core.budgets, authentication can take two queries
+    query_budgets = {'list': 3, 'autocomplete': 3}
 
     def get_queryset(self):
         """Return attrs for authenticated users"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        return self.queryset.for_user(self.request.user).order_by('-name')
 
     def perform_create(self, serializer):
         """Saves object"""
-        serializer.save(user=self.request.user)
+        # post_save records the outbox event, it must commit with the row
+        with transaction.atomic(using=shard_for_user(self.request.user)):
+            serializer.save(user=self.request.user)
+
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Names matching ?q=, starting with it first (?limit=, max 50)"""
+        text = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        if not text or limit <= 0:
+            return Response([])
+        return Response([
+            {'id': pk, 'name': name} for pk, name in
+            complete_names(self.queryset, request.user, text, limit)
+        ])
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -39,17 +80,46 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """Manage recipes in the database"""
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
+    # set by actions needing their own throttling rate
+    throttle_scope = None
+    # see core.budgets, authentication can take two queries
+    query_budgets = {'list': 5, 'retrieve': 5}
+    query_budget = None
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user"""
-        return self.queryset.filter(user=self.request.user)
+        recipes = self.queryset.for_user(self.request.user)
+        if self.action in ('list', 'retrieve'):
+            recipes = recipes.prefetch_related('tags', 'ingredients')
+        return recipes
     
+    def retrieve(self, request, *args, **kwargs):
+        """Return the recipe detail, precomputed if documents are on"""
+        pk = kwargs[self.lookup_field]
+        if documents.enabled() and pk.isdigit() and \
+                request.accepted_renderer.format == 'json' and \
+                documents.serves(request):
+            document = documents.get_document(request.user, pk)
+            if document is not None:
+                body, etag = document
+                if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+                    response = HttpResponse(
+                        status=status.HTTP_304_NOT_MODIFIED
+                    )
+                else:
+                    response = HttpResponse(
+                        body, content_type='application/json'
+                    )
+                response['ETag'] = etag
+                return response
+        return super().retrieve(request, *args, **kwargs)
+
     # use a different serializer for different actions
     def get_serializer_class(self):
         """Return appropiate serializer class"""
@@ -59,6 +129,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # see this action below
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'bulk_update':
+            return RecipeBulkUpdateSerializer
+        elif self.action == 'bulk_delete':
+            return RecipeBulkDeleteSerializer
         return super().get_serializer_class()
     
     # para post, patch y put
@@ -66,9 +140,127 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         return serializer.save(user=self.request.user)
     
+    def select_recipes(self):
+        """Validate a bulk request, return its data and selected recipes"""
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        recipes = bulk.select_recipes(self.request.user, **data['filter'])
+        if recipes.count() > BULK_MAX_RECIPES:
+            raise ValidationError({'filter': [
+                f'Selects more than {BULK_MAX_RECIPES} recipes.'
+            ]})
+        return data, recipes
+
+    @action(methods=['POST'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Set fields, add and remove tags/ingredients of many recipes"""
+        data, recipes = self.select_recipes()
+        ids = bulk.bulk_update(
+            recipes, data.get('set'),
+            add={
+                'tags': data.get('add_tags'),
+                'ingredients': data.get('add_ingredients'),
+            },
+            remove={
+                'tags': data.get('remove_tags'),
+                'ingredients': data.get('remove_ingredients'),
+            }
+        )
+        return Response({'updated': ids})
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many recipes"""
+        _, recipes = self.select_recipes()
+        return Response({'deleted': bulk.bulk_delete(recipes)})
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Aggregates over the user's recipes, per tag and ingredient"""
+        return Response(recipe_stats(request.user))
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Ingredients of the recipes ?ids=1,2,3 and the recipes using them"""
+        ids = request.query_params.get('ids', '')
+        try:
+            ids = {int(pk) for pk in ids.split(',') if pk.strip()}
+        except ValueError:
+            ids = None
+        if not ids or len(ids) > SHOPPING_LIST_MAX_RECIPES:
+            return Response(
+                {'detail': f'ids must list 1 to {SHOPPING_LIST_MAX_RECIPES} '
+                           f'recipe ids, separated by commas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(shopping_list(request.user, ids))
+
+    @action(methods=['GET'], detail=True, query_budget=9)
+    def similar(self, request, pk=None):
+        """Recipes sharing the most tags and ingredients (?limit=, max 50)"""
+        recipe = self.get_object()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        scores = dict(similar_recipes(recipe, limit))
+        recipes = self.get_queryset().filter(
+            pk__in=scores
+        ).prefetch_related('tags', 'ingredients')
+        data = []
+        for item in self.get_serializer(recipes, many=True).data:
+            item['similarity'] = round(scores[item['id']], 4)
+            data.append(item)
+        data.sort(key=lambda item: -item['similarity'])
+        return Response(data)
+
+    @action(methods=['GET'], detail=True)
+    def image(self, request, pk=None):
+        """Return the recipe image resized, ?width=<px>&fmt=jpeg|png|webp"""
+        recipe = self.get_object()
+        if not recipe.image:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        fmt = request.query_params.get('fmt', 'jpeg')
+        try:
+            width = int(request.query_params.get('width', 640))
+        except ValueError:
+            width = 0
+        if fmt not in FORMATS or width <= 0:
+            return Response(
+                {'detail': f'width must be positive, fmt one of '
+                           f'{", ".join(FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        width = rendition_width(width)
+        etag = f'"{rendition_key(recipe.image.name, width, fmt)}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            try:
+                rendition = open_rendition(
+                    recipe.image.name, recipe.image.path, width, fmt
+                )
+            except FileNotFoundError:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            except OSError:
+                # Pillow can't read the image (UnidentifiedImageError...)
+                return Response(
+                    {'detail': 'The recipe image can not be read.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            response = FileResponse(
+                rendition, content_type=FORMATS[fmt][1]
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
     # using the decorator, I can develop an ad hoc endpoint
     # detail=True is for using the URL with id
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_scope='upload')
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
         # retrieving object (based on the id)
@@ -89,3 +281,63 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+
+class ChangesView(APIView):
+    """Recipes, tags and ingredients changed or deleted since ?since=<cursor>
+
+    Clients keep the returned cursor for their next sync; without one
+    (or with one too old) everything is returned, with 'full' set.
+    """
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = sync.decode_cursor(since)
+            except (ValueError, OverflowError):
+                return Response(
+                    {'detail': 'Invalid cursor.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response(sync.changes(request.user, since or None))
+
+
+class EventStreamView(APIView):
+    """Server-sent events of the user's recipe, tag and ingredient changes
+
+    Each event is {type, action, ids, cursor}; after a reconnect or an
+    'overflow' event, clients catch up with /changes/?since=<cursor>.
+    """
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (JSONRenderer, events.EventStreamRenderer)
+
+    def get(self, request):
+        subscription = events.bus.subscribe(
+            request.user.pk, settings.EVENT_STREAM_MAX_OPEN
+        )
+        if subscription is None:
+            return Response(
+                {'detail': 'Too many open event streams, retry later.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '30'}
+            )
+        events.ensure_listener(shard_for_user(request.user))
+        # the stream mostly waits, don't keep database connections for it
+        for connection in connections.all():
+            if not connection.in_atomic_block:
+                connection.close()
+        response = StreamingHttpResponse(
+            events.EventStream(
+                subscription,
+                settings.EVENT_STREAM_HEARTBEAT_SECONDS,
+                settings.EVENT_STREAM_MAX_SECONDS
+            ),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # nginx would buffer the events otherwise
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -1,9 +1,9 @@
 from rest_framework import viewsets, mixins, generics, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 
+from core.authentication import ExpiringTokenAuthentication
 from core.models import Tag, Ingredient
 from recipe.serializers import TagSerializer, IngredientSerializer
 # Create your views here.
@@ -13,7 +13,7 @@ class TagViewSet(viewsets.GenericViewSet,
                  mixins.ListModelMixin,
                  mixins.CreateModelMixin):
     """Manage tags in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -40,7 +40,7 @@ class IngredientViewSet(viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin):
     """Manage ingredients"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -57,7 +57,7 @@ class IngredientViewSet(viewsets.GenericViewSet,
 
 # ad hoc view (just for fun)
 class IngredientCreateView(generics.CreateAPIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = IngredientSerializer
     # queryset = Ingredient.objects.all()
@@ -42,6 +42,12 @@ class AuthTokenSerializer(serializers.Serializer):
         # this is True by deafult, we change it
         trim_whitespace=False
     )
+    # name of the client device, tokens are issued per device
+    device = serializers.CharField(
+        max_length=255,
+        required=False,
+        default=''
+    )
 
     # validate, using Django REST Framework serializers as a base
     def validate(self, attrs):
@@ -1,10 +1,11 @@
-from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.tests.utils import TestCase
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -1,12 +1,19 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
 from users.serializers import UserSerializer, AuthTokenSerializer
-from core.models import User
+from core.authentication import (
+    ExpiringTokenAuthentication, revoked_tokens, token_cache
+)
+from core.idempotency import IdempotentCreateMixin
+from core.models import AuthToken, User
+from core.throttling import LoginRateThrottle
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(IdempotentCreateMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
 
@@ -16,12 +23,40 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     # centralize the rendering in api_settings
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    # every attempt costs a password hash, keep them few
+    throttle_classes = (LoginRateThrottle,)
+
+    def post(self, request, *args, **kwargs):
+        """Issue a new expiring token, one per login (device)"""
+        serializer = self.serializer_class(data=request.data,
+                                           context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        token = AuthToken.objects.issue(
+            serializer.validated_data['user'],
+            device=serializer.validated_data['device']
+        )
+        return Response({'token': token.key, 'expires': token.expires})
+
+
+class RevokeTokenView(APIView):
+    """Revoke the token used to authenticate (log out)"""
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        token = AuthToken.objects.filter(key=request.auth).first()
+        if token is not None:
+            token.revoke()
+            revoked_tokens.add(token.key, token.expires)
+            token_cache.forget(token.key)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):